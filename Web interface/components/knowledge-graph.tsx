@@ -34,14 +34,22 @@ export function KnowledgeGraph() {
   const generateGraph = async () => {
     setLoading(true)
     try {
-      const data = await apiClient.generateKnowledgeGraph(topN)
+      const { job_id } = await apiClient.generateKnowledgeGraph(topN)
+
+      // 图谱在后台生成，轮询任务状态直到完成
+      let job = await apiClient.getKnowledgeGraphStatus(job_id)
+      while (job.status === "running") {
+        await new Promise((resolve) => setTimeout(resolve, 2000))
+        job = await apiClient.getKnowledgeGraphStatus(job_id)
+      }
+      if (job.status === "failed") throw new Error(job.error || "Generation failed")
 
       setGraphUrl(apiClient.getKnowledgeGraphViewURL())
-      setStats(data.statistics)
+      setStats(job.statistics ?? null)
 
       toast({
         title: "生成成功",
-        description: data.message,
+        description: job.message,
       })
     } catch (error) {
       toast({
@@ -13,6 +13,7 @@ export interface UploadResponse {
   filename: string
   size: number
   path: string
+  job_id: string
 }
 
 export interface DeleteResponse {
@@ -32,8 +33,17 @@ export interface KnowledgeGraphStats {
 
 export interface KnowledgeGraphResponse {
   message: string
-  html_url: string
-  statistics: KnowledgeGraphStats
+  job_id: string
+  status: string
+  status_url: string
+}
+
+export interface KnowledgeGraphJob {
+  status: "running" | "completed" | "failed"
+  message?: string
+  html_url?: string
+  statistics?: KnowledgeGraphStats
+  error?: string
 }
 
 export interface EntityRelation {
@@ -188,6 +198,11 @@ class APIClient {
   }
 
 
+  async getKnowledgeGraphStatus(jobId: string): Promise<KnowledgeGraphJob> {
+    const response = await fetch(`${this.baseURL}/api/knowledge-graph/status/${encodeURIComponent(jobId)}`)
+    if (!response.ok) throw new Error("Failed to fetch knowledge graph status")
+    return response.json()
+  }
 
   async getEntityInfo(entityName: string): Promise<EntityInfo> {
     const response = await fetch(`${this.baseURL}/api/knowledge-graph/entity/${encodeURIComponent(entityName)}`)
@@ -2,17 +2,25 @@
 FastAPI后端应用 - RAG知识问答系统
 提供文件管理、知识图谱生成和问答接口
 """
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse, HTMLResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Request
+from fastapi.responses import ORJSONResponse, FileResponse, HTMLResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 from pathlib import Path
-import shutil
-import json
+import asyncio
+import os
+import time
+import aiofiles
+import aiofiles.os as aios
 import uvicorn
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+from uuid import uuid4
 
 from rag_system import EnhancedRAGSystem
 from knowledge_graph import KnowledgeGraphBuilder
@@ -22,7 +30,8 @@ from config import RAGConfig
 app = FastAPI(
     title="RAG知识问答系统",
     description="基于检索增强生成的智能问答系统，支持文件管理、知识图谱和问答功能",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # 配置CORS
@@ -34,17 +43,102 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 压缩较大的响应（问答结果、文件列表等JSON）
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # 全局变量
 rag_system: Optional[EnhancedRAGSystem] = None
 kg_builder: Optional[KnowledgeGraphBuilder] = None
 config = RAGConfig()
 
+# 后台任务状态: job_id -> {"status": "running" | "completed" | "failed" | "superseded" | "cancelled", ...}
+jobs: Dict[str, Dict] = {}
+# 已结束任务的结束时间（time.monotonic，按结束顺序），超过保留时长或数量上限时从jobs中清理
+finished_jobs: "OrderedDict[str, float]" = OrderedDict()
+
+# 知识图谱构建是CPU密集型任务，放到独立进程中执行，避免阻塞事件循环
+kg_executor = ProcessPoolExecutor(max_workers=1)
+
+# 待索引的上传文件: 文件路径 -> 任务ID，由后台协程合并处理
+pending_files: Dict[str, str] = {}
+rebuild_event = asyncio.Event()
+rebuild_task: Optional[asyncio.Task] = None
+rebuild_state: Dict = {"status": "idle", "last_batch_size": 0, "last_finished_at": None, "last_error": None}
+
 # 确保必要的目录存在
 DOCUMENTS_DIR = Path(config.DOCUMENTS_DIR)
 DOCUMENTS_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR = Path("outputs")
 OUTPUT_DIR.mkdir(exist_ok=True)
 
+# 上传文件时每次读取的块大小（1 MiB）
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# 根路径页面内容固定，启动时编码一次，避免每次请求重复构造
+ROOT_HTML = """
+    <html>
+        <head>
+            <title>RAG知识问答系统</title>
+            <style>
+                body {
+                    font-family: Arial, sans-serif;
+                    max-width: 800px;
+                    margin: 50px auto;
+                    padding: 20px;
+                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+                    color: white;
+                }
+                .container {
+                    background: rgba(255, 255, 255, 0.95);
+                    padding: 40px;
+                    border-radius: 10px;
+                    color: #2c3e50;
+                }
+                h1 { color: #667eea; }
+                a {
+                    color: #667eea;
+                    text-decoration: none;
+                    font-weight: bold;
+                }
+                a:hover { text-decoration: underline; }
+                .endpoint {
+                    background: #f8f9fa;
+                    padding: 10px;
+                    margin: 10px 0;
+                    border-radius: 5px;
+                    border-left: 4px solid #667eea;
+                }
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <h1>🔍 RAG知识问答系统</h1>
+                <p>欢迎使用基于检索增强生成的智能问答系统</p>
+                
+                <h2>📚 主要功能</h2>
+                <div class="endpoint">
+                    <strong>文件管理:</strong> 上传、查看、删除文档
+                </div>
+                <div class="endpoint">
+                    <strong>知识图谱:</strong> 自动生成实体关系图谱
+                </div>
+                <div class="endpoint">
+                    <strong>智能问答:</strong> 基于文档内容的精准回答
+                </div>
+                
+                <h2>📖 API文档</h2>
+                <p>访问 <a href="/docs">/docs</a> 查看完整的API文档</p>
+                <p>访问 <a href="/redoc">/redoc</a> 查看ReDoc格式文档</p>
+                
+                <h2>🚀 快速开始</h2>
+                <p>1. 上传文档: POST /api/files/upload</p>
+                <p>2. 生成知识图谱: POST /api/knowledge-graph/generate</p>
+                <p>3. 提问: POST /api/qa</p>
+            </div>
+        </body>
+    </html>
+    """.encode('utf-8')
+
 # 挂载静态文件目录
 app.mount("/outputs", StaticFiles(directory="outputs"), name="outputs")
 
@@ -87,7 +181,10 @@ class KnowledgeGraphRequest(BaseModel):
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化RAG系统"""
-    global rag_system, kg_builder
+    global rag_system, kg_builder, rebuild_task
+    
+    # 启动合并索引的后台协程
+    rebuild_task = asyncio.create_task(_rebuild_loop())
     
     print("=" * 60)
     print("正在启动RAG系统...")
@@ -111,6 +208,135 @@ async def startup_event():
 async def shutdown_event():
     """应用关闭时清理资源"""
     print("\n正在关闭RAG系统...")
+    if rebuild_task:
+        rebuild_task.cancel()
+    kg_executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ==================== 后台任务 ====================
+
+def _create_job(**info) -> str:
+    """登记一个新的后台任务，返回任务ID"""
+    _prune_jobs()
+    job_id = uuid4().hex
+    jobs[job_id] = {"status": "running", "created_at": datetime.now().isoformat(), **info}
+    return job_id
+
+
+def _finish_job(job_id: str, status: str, **info) -> None:
+    """将任务标记为结束状态，之后按保留时长清理"""
+    jobs[job_id].update({"status": status, "finished_at": datetime.now().isoformat(), **info})
+    finished_jobs[job_id] = time.monotonic()
+    _prune_jobs()
+
+
+def _prune_jobs() -> None:
+    """清理超过保留时长的已结束任务；已结束任务超过数量上限时先清理最早结束的"""
+    deadline = time.monotonic() - config.JOB_TTL_SECONDS
+    while finished_jobs:
+        job_id, finished_at = next(iter(finished_jobs.items()))
+        if finished_at > deadline and len(finished_jobs) <= config.MAX_FINISHED_JOBS:
+            break
+        finished_jobs.popitem(last=False)
+        jobs.pop(job_id, None)
+
+
+def _get_job(job_id: str) -> Dict:
+    """获取后台任务状态"""
+    if job_id not in jobs:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return jobs[job_id]
+
+
+def _build_knowledge_graph(documents: List[Dict], top_n: int, output_path: str) -> KnowledgeGraphBuilder:
+    """在工作进程中构建知识图谱并生成可视化"""
+    builder = KnowledgeGraphBuilder(custom_words=config.CUSTOM_WORDS)
+    builder.build_graph_from_documents(documents)
+    
+    output = Path(output_path)
+    if output.exists():
+        output.unlink()
+    builder.visualize_interactive(output_path=output_path, top_n=top_n)
+    return builder
+
+
+async def _run_kg_job(job_id: str, top_n: int):
+    """后台执行知识图谱生成任务"""
+    global kg_builder
+    
+    try:
+        output_path = OUTPUT_DIR / "knowledge_graph.html"
+        loop = asyncio.get_running_loop()
+        builder = await loop.run_in_executor(
+            kg_executor,
+            _build_knowledge_graph,
+            list(rag_system.documents),
+            top_n,
+            str(output_path)
+        )
+        kg_builder = builder
+        _finish_job(
+            job_id, "completed",
+            message="知识图谱生成成功",
+            html_url="/outputs/knowledge_graph.html",
+            statistics=builder.get_statistics()
+        )
+    except Exception as e:
+        _finish_job(job_id, "failed", error=f"知识图谱生成失败: {str(e)}")
+
+
+def _index_files(file_paths: List[str]) -> Dict[str, int]:
+    """在线程中批量加载文件并加入检索索引，返回每个文件新增的文档块数量"""
+    global rag_system
+    
+    if rag_system is None:
+        # 系统尚未初始化时直接完整加载文档文件夹（已包含新文件）
+        rag_system = EnhancedRAGSystem()
+        return {
+            path: sum(1 for chunk in rag_system.document_chunks
+                      if chunk["title"] == rag_system._document_title(path))
+            for path in file_paths
+        }
+    return rag_system.add_documents(file_paths)
+
+
+async def _rebuild_loop():
+    """
+    合并上传突发：等待上传停顿 REBUILD_DEBOUNCE_SECONDS 秒，
+    或待处理文件达到 REBUILD_MAX_PENDING 个后，一次性更新索引
+    """
+    while True:
+        await rebuild_event.wait()
+        
+        while len(pending_files) < config.REBUILD_MAX_PENDING:
+            rebuild_event.clear()
+            try:
+                await asyncio.wait_for(rebuild_event.wait(), timeout=config.REBUILD_DEBOUNCE_SECONDS)
+            except asyncio.TimeoutError:
+                break
+        rebuild_event.clear()
+        
+        batch = dict(pending_files)
+        pending_files.clear()
+        if not batch:
+            continue
+        
+        rebuild_state.update({"status": "running", "last_batch_size": len(batch)})
+        try:
+            added = await asyncio.to_thread(_index_files, list(batch))
+            for path, job_id in batch.items():
+                _finish_job(job_id, "completed", chunks=added.get(path, 0))
+            rebuild_state["last_error"] = None
+        except Exception as e:
+            error = f"索引更新失败: {str(e)}"
+            for job_id in batch.values():
+                _finish_job(job_id, "failed", error=error)
+            rebuild_state["last_error"] = error
+        
+        rebuild_state.update({
+            "status": "pending" if pending_files else "idle",
+            "last_finished_at": datetime.now().isoformat()
+        })
 
 
 # ==================== 健康检查 ====================
@@ -118,69 +344,7 @@ async def shutdown_event():
 @app.get("/", response_class=HTMLResponse)
 async def root():
     """根路径 - 返回API文档链接"""
-    return """
-    <html>
-        <head>
-            <title>RAG知识问答系统</title>
-            <style>
-                body {
-                    font-family: Arial, sans-serif;
-                    max-width: 800px;
-                    margin: 50px auto;
-                    padding: 20px;
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    color: white;
-                }
-                .container {
-                    background: rgba(255, 255, 255, 0.95);
-                    padding: 40px;
-                    border-radius: 10px;
-                    color: #2c3e50;
-                }
-                h1 { color: #667eea; }
-                a {
-                    color: #667eea;
-                    text-decoration: none;
-                    font-weight: bold;
-                }
-                a:hover { text-decoration: underline; }
-                .endpoint {
-                    background: #f8f9fa;
-                    padding: 10px;
-                    margin: 10px 0;
-                    border-radius: 5px;
-                    border-left: 4px solid #667eea;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>🔍 RAG知识问答系统</h1>
-                <p>欢迎使用基于检索增强生成的智能问答系统</p>
-                
-                <h2>📚 主要功能</h2>
-                <div class="endpoint">
-                    <strong>文件管理:</strong> 上传、查看、删除文档
-                </div>
-                <div class="endpoint">
-                    <strong>知识图谱:</strong> 自动生成实体关系图谱
-                </div>
-                <div class="endpoint">
-                    <strong>智能问答:</strong> 基于文档内容的精准回答
-                </div>
-                
-                <h2>📖 API文档</h2>
-                <p>访问 <a href="/docs">/docs</a> 查看完整的API文档</p>
-                <p>访问 <a href="/redoc">/redoc</a> 查看ReDoc格式文档</p>
-                
-                <h2>🚀 快速开始</h2>
-                <p>1. 上传文档: POST /api/files/upload</p>
-                <p>2. 生成知识图谱: POST /api/knowledge-graph/generate</p>
-                <p>3. 提问: POST /api/qa</p>
-            </div>
-        </body>
-    </html>
-    """
+    return Response(content=ROOT_HTML, media_type="text/html")
 
 
 @app.get("/api/health")
@@ -196,28 +360,41 @@ async def health_check():
 
 # ==================== 文件管理接口 ====================
 
-@app.get("/api/files", response_model=List[FileInfo])
+@app.get("/api/files", responses={200: {"model": List[FileInfo]}})
 async def list_files():
     """获取所有已上传的文件列表"""
     try:
-        files = []
-        for file_path in DOCUMENTS_DIR.iterdir():
-            if file_path.is_file():
-                stat = file_path.stat()
+        # 目录遍历和stat在线程中执行，避免慢速文件系统阻塞事件循环
+        return await asyncio.to_thread(_scan_documents_dir)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取文件列表失败: {str(e)}")
+
+
+@lru_cache(maxsize=65536)
+def _format_mtime(mtime: int) -> str:
+    """将修改时间（整数秒）格式化为ISO字符串，同一秒的结果直接复用"""
+    return datetime.fromtimestamp(mtime).isoformat()
+
+
+def _scan_documents_dir() -> List[Dict]:
+    """遍历文档文件夹，收集文件信息"""
+    files = []
+    with os.scandir(DOCUMENTS_DIR) as it:
+        for entry in it:
+            if entry.is_file():
+                stat = entry.stat()
                 files.append({
-                    "filename": file_path.name,
+                    "filename": entry.name,
                     "size": stat.st_size,
-                    "upload_time": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                    "path": str(file_path.relative_to(DOCUMENTS_DIR))
+                    "upload_time": _format_mtime(int(stat.st_mtime)),
+                    "path": entry.name
                 })
-        return files
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"获取文件列表失败: {str(e)}")
+    return files
 
 
 @app.post("/api/files/upload")
 async def upload_file(file: UploadFile = File(...)):
-    """上传文档文件"""
+    """上传文档文件，索引在后台合并更新"""
     try:
         # 检查文件类型
         allowed_extensions = {'.txt', '.md', '.pdf', '.docx', '.doc'}
@@ -229,21 +406,31 @@ async def upload_file(file: UploadFile = File(...)):
                 detail=f"不支持的文件类型: {file_ext}。支持的类型: {', '.join(allowed_extensions)}"
             )
         
-        # 保存文件
+        # 保存文件（异步分块写入，避免阻塞事件循环）
         file_path = DOCUMENTS_DIR / file.filename
         
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await buffer.write(chunk)
         
-        # 重新初始化RAG系统以加载新文件
-        global rag_system
-        rag_system = EnhancedRAGSystem()
+        # 登记到待索引队列，由后台协程合并多个上传后统一增量加载
+        job_id = _create_job(type="index", filename=file.filename)
+        previous_job = pending_files.get(str(file_path))
+        if previous_job:
+            _finish_job(previous_job, "superseded", superseded_by=job_id)
+        pending_files[str(file_path)] = job_id
+        if rebuild_state["status"] == "idle":
+            rebuild_state["status"] = "pending"
+        rebuild_event.set()
+        
+        file_stat = await aios.stat(file_path)
         
         return {
             "message": "文件上传成功",
             "filename": file.filename,
-            "size": file_path.stat().st_size,
-            "path": str(file_path.relative_to(DOCUMENTS_DIR))
+            "size": file_stat.st_size,
+            "path": str(file_path.relative_to(DOCUMENTS_DIR)),
+            "job_id": job_id
         }
     except HTTPException:
         raise
@@ -257,18 +444,26 @@ async def delete_file(filename: str):
     try:
         file_path = DOCUMENTS_DIR / filename
         
-        if not file_path.exists():
+        if not await aios.path.exists(file_path):
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        if not file_path.is_file():
+        if not await aios.path.isfile(file_path):
             raise HTTPException(status_code=400, detail="不是有效的文件")
         
         # 删除文件
-        file_path.unlink()
+        await aios.remove(file_path)
+        
+        # 尚未索引的文件直接从待处理队列中移除
+        pending_job = pending_files.pop(str(file_path), None)
+        if pending_job:
+            _finish_job(pending_job, "cancelled", message="文件已删除")
         
-        # 重新初始化RAG系统
+        # 从检索索引中增量移除该文件
         global rag_system
-        rag_system = EnhancedRAGSystem()
+        if rag_system is None:
+            rag_system = await asyncio.to_thread(EnhancedRAGSystem)
+        else:
+            await asyncio.to_thread(rag_system.remove_document, str(file_path))
         
         return {
             "message": "文件删除成功",
@@ -280,13 +475,25 @@ async def delete_file(filename: str):
         raise HTTPException(status_code=500, detail=f"文件删除失败: {str(e)}")
 
 
+@app.get("/api/files/rebuild-status")
+async def get_rebuild_status():
+    """查询后台索引合并状态"""
+    return {**rebuild_state, "pending": len(pending_files)}
+
+
+@app.get("/api/files/status/{job_id}")
+async def get_index_status(job_id: str):
+    """查询文件索引任务状态"""
+    return _get_job(job_id)
+
+
 @app.get("/api/files/{filename}/download")
 async def download_file(filename: str):
     """下载指定文件"""
     try:
         file_path = DOCUMENTS_DIR / filename
         
-        if not file_path.exists():
+        if not await aios.path.exists(file_path):
             raise HTTPException(status_code=404, detail="文件不存在")
         
         return FileResponse(
@@ -307,46 +514,46 @@ async def generate_knowledge_graph(
     background_tasks: BackgroundTasks,
     request: KnowledgeGraphRequest = KnowledgeGraphRequest()
 ):
-    """生成知识图谱"""
+    """提交知识图谱生成任务，立即返回任务ID"""
     if not rag_system or not rag_system.documents:
         raise HTTPException(status_code=400, detail="没有可用的文档，请先上传文档")
     
-    try:
-        global kg_builder
-        kg_builder = KnowledgeGraphBuilder(custom_words=config.CUSTOM_WORDS)
-        
-        # 构建知识图谱
-        kg_builder.build_graph_from_documents(rag_system.documents)
-        
-        # 生成可视化
-        output_path = OUTPUT_DIR / "knowledge_graph.html"
-        if output_path.exists():
-            output_path.unlink()
-        kg_builder.visualize_interactive(
-            output_path=str(output_path),
-            top_n=request.top_n
-        )
-        
-        # 获取统计信息
-        stats = kg_builder.get_statistics()
-        
-        return {
-            "message": "知识图谱生成成功",
-            "html_url": f"/outputs/knowledge_graph.html",
-            "statistics": stats
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"知识图谱生成失败: {str(e)}")
+    job_id = _create_job(type="knowledge_graph", top_n=request.top_n)
+    background_tasks.add_task(_run_kg_job, job_id, request.top_n)
+    
+    return {
+        "message": "知识图谱生成任务已提交",
+        "job_id": job_id,
+        "status": "running",
+        "status_url": f"/api/knowledge-graph/status/{job_id}"
+    }
+
+
+@app.get("/api/knowledge-graph/status/{job_id}")
+async def get_knowledge_graph_status(job_id: str):
+    """查询知识图谱生成任务状态"""
+    return _get_job(job_id)
 
 
 @app.get("/api/knowledge-graph/view")
-async def view_knowledge_graph():
+async def view_knowledge_graph(request: Request):
     """查看知识图谱"""
     graph_path = OUTPUT_DIR / "knowledge_graph.html"
     
     if not graph_path.exists():
         raise HTTPException(status_code=404, detail="知识图谱未生成，请先生成知识图谱")
     
+    # 客户端支持gzip时直接返回生成时预压缩的文件
+    gz_path = graph_path.with_name(graph_path.name + ".gz")
+    if ("gzip" in request.headers.get("accept-encoding", "")
+            and gz_path.exists()
+            and gz_path.stat().st_mtime >= graph_path.stat().st_mtime):
+        return FileResponse(
+            path=gz_path,
+            media_type='text/html',
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+        )
+    
     return FileResponse(
         path=graph_path,
         media_type='text/html'
@@ -397,7 +604,7 @@ async def ask_question(request: QueryRequest):
     
     try:
         # 执行RAG查询
-        result = rag_system.ask(
+        result = await rag_system.aask(
             query=request.query,
             use_cache=request.use_cache,
             top_k=request.top_k,
@@ -433,7 +640,7 @@ async def clear_cache():
         raise HTTPException(status_code=503, detail="RAG系统未初始化")
     
     try:
-        rag_system.cache_manager.clear()
+        rag_system.clear_cache()
         return {"message": "缓存已清除"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"清除缓存失败: {str(e)}")
@@ -482,10 +689,23 @@ if __name__ == "__main__":
     print(f"输出目录: {OUTPUT_DIR.absolute()}")
     print("=" * 60)
     
-    uvicorn.run(
-        "app:app",
-        host="0.0.0.0",
-        port=4210,
-        reload=True,  # 开发模式下启用热重载
-        log_level="info"
-    )
+    if config.SERVER_DEV_MODE:
+        uvicorn.run(
+            "app:app",
+            host=config.SERVER_HOST,
+            port=config.SERVER_PORT,
+            reload=True,  # 开发模式下启用热重载
+            log_level="info"
+        )
+    else:
+        # 生产模式: 关闭热重载和访问日志，安装 uvicorn[standard] 后自动使用uvloop和httptools
+        uvicorn.run(
+            "app:app",
+            host=config.SERVER_HOST,
+            port=config.SERVER_PORT,
+            workers=config.SERVER_WORKERS,
+            loop="auto",
+            http="auto",
+            log_level="warning",
+            access_log=False
+        )
@@ -1,77 +1,557 @@
 """
-缓存管理模块 - 管理查询缓存
+缓存管理模块 - 管理查询缓存和文档块嵌入缓存
+查询缓存使用SQLite持久化存储 + 内存LRU热缓存，可选语义缓存（HNSW索引，未安装hnswlib时精确内积检索）
 """
-import json
+import sqlite3
+import hashlib
+import threading
+import time
+import atexit
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import orjson
+
+try:
+    import hnswlib
+except ImportError:  # 未安装时语义缓存退回numpy精确检索
+    hnswlib = None
+
+
+class _FlatIndex:
+    """
+    精确内积索引：提供语义缓存用到的hnswlib.Index接口子集
+    向量已归一化，内积即余弦相似度；缓存条目通常只有数千条，一次矩阵-向量乘法即可
+    """
+
+    def __init__(self, dim: int, max_elements: int):
+        self._data = np.empty((min(max_elements, 256), dim), dtype=np.float32)
+        self._count = 0
+
+    def get_current_count(self) -> int:
+        return self._count
+
+    def get_max_elements(self) -> int:
+        return len(self._data)
+
+    def resize_index(self, max_elements: int):
+        data = np.empty((max_elements, self._data.shape[1]), dtype=np.float32)
+        data[:self._count] = self._data[:self._count]
+        self._data = data
+
+    def add_items(self, vectors: np.ndarray, ids):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self._data.shape[1])
+        end = self._count + len(vectors)
+        if end > len(self._data):
+            self.resize_index(max(end, 2 * len(self._data)))
+        self._data[self._count:end] = vectors
+        self._count = end
+
+    def knn_query(self, vector: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (标签, 余弦距离)，形状与hnswlib一致"""
+        similarities = self._data[:self._count] @ np.asarray(vector, dtype=np.float32).reshape(-1)
+        labels = np.argsort(-similarities, kind='stable')[:k]
+        return labels[None, :], (1.0 - similarities[labels])[None, :]
 
 
 class CacheManager:
     """缓存管理器 - 管理查询结果缓存，提升重复查询的响应速度"""
-    
-    def __init__(self, cache_file: Path):
+
+    def __init__(
+        self,
+        cache_file: Path,
+        max_size: int = 1024,
+        embedding_fn: Optional[Callable[[str], np.ndarray]] = None,
+        embedding_dim: Optional[int] = None,
+        semantic_threshold: float = 0.95,
+        semantic_max_elements: int = 10000,
+        flush_interval: float = 1.0,
+        flush_batch: int = 64
+    ):
         """
         初始化缓存管理器
-        
+
         参数:
-            cache_file: 缓存文件路径
+            cache_file: 缓存数据库文件路径
+            max_size: 内存热缓存（LRU）的最大条目数
+            embedding_fn: 查询嵌入函数，提供时启用语义缓存（返回归一化向量）
+            embedding_dim: 嵌入向量维度
+            semantic_threshold: 语义命中的余弦相似度阈值
+            semantic_max_elements: HNSW索引的初始容量
+            flush_interval: 后台写入数据库的间隔（秒）
+            flush_batch: 待写入条目达到该数量时立即写入
         """
         self.cache_file = cache_file
-        self.cache = {}
+        self.max_size = max_size
+        self.cache = OrderedDict()  # 内存热缓存: key -> 结果字典
+        self._lock = threading.Lock()
+
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            str(self.cache_file),
+            isolation_level=None,  # 自动提交，批量写入时显式开启事务
+            check_same_thread=False
+        )
+
+        # 延迟写入：set只更新内存，后台线程定期批量写入数据库
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._dirty: Dict[str, Tuple[Dict, float, Optional[int]]] = {}  # key -> (结果, 时间戳, embedding_id)
+        self._generation = 0  # clear()时递增，丢弃清除前取出的待写入条目
+        self._flush_event = threading.Event()
+        self._closed = False
+
+        self._init_db()
         self._load_cache()
-    
+
+        self._flush_thread = threading.Thread(target=self._flush_loop, name="cache-flush", daemon=True)
+        self._flush_thread.start()
+        atexit.register(self.close)
+
+        # 语义缓存（可选）
+        self.embedding_fn = embedding_fn
+        self.embedding_dim = embedding_dim
+        self.semantic_threshold = semantic_threshold
+        self.semantic_max_elements = semantic_max_elements
+        self._index_file = self.cache_file.with_suffix('.hnsw')
+        self._vectors_file = self.cache_file.with_suffix('.npy')
+        self._index = None  # hnswlib.Index 或 _FlatIndex
+        self._vectors = []  # 与索引并行的float32向量，embedding_id即下标
+        self._last_embedding = (None, None)  # 避免get/set对同一查询重复编码
+
+        if embedding_fn is not None:
+            if not embedding_dim:
+                print("✗ 未提供嵌入维度，语义缓存已禁用")
+            else:
+                self._load_semantic_index()
+                atexit.register(self.save_semantic_index)
+
+    @property
+    def semantic_enabled(self) -> bool:
+        """是否启用了语义缓存"""
+        return self._index is not None
+
+    def _init_db(self):
+        """初始化SQLite表结构（WAL模式）"""
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB, ts REAL, embedding_id INTEGER)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(cache)")}
+            if "embedding_id" not in columns:
+                self._conn.execute("ALTER TABLE cache ADD COLUMN embedding_id INTEGER")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_ts ON cache(ts)")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_embedding ON cache(embedding_id)"
+            )
+        except sqlite3.DatabaseError as e:
+            print(f"缓存文件损坏，重新创建缓存: {e}")
+            self._conn.close()
+            self.cache_file.unlink(missing_ok=True)
+            self._conn = sqlite3.connect(
+                str(self.cache_file),
+                isolation_level=None,
+                check_same_thread=False
+            )
+            self._init_db()
+
+    @staticmethod
+    def _make_key(query: str) -> str:
+        """根据查询文本生成缓存键"""
+        return hashlib.blake2b(query.encode('utf-8'), digest_size=16).hexdigest()
+
+    @staticmethod
+    def _dumps(result: Dict) -> bytes:
+        """序列化查询结果"""
+        return orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+    @staticmethod
+    def _loads(value: bytes) -> Dict:
+        """反序列化查询结果"""
+        return orjson.loads(value)
+
     def _load_cache(self):
-        """从文件加载缓存数据"""
-        if self.cache_file.exists():
-            try:
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    self.cache = json.load(f)
-                print(f"加载缓存: {len(self.cache)} 条记录")
-            except Exception as e:
-                print(f"缓存文件损坏，重新创建缓存: {e}")
-                self.cache = {}
-    
-    def save_cache(self):
-        """保存缓存到文件"""
+        """从数据库预加载最近的记录到内存热缓存"""
         try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.cache, f, ensure_ascii=False, indent=2)
+            rows = self._conn.execute(
+                "SELECT key, value FROM cache ORDER BY ts DESC LIMIT ?",
+                (self.max_size,)
+            ).fetchall()
+            # 按时间从旧到新插入，保证最近使用的位于LRU末尾
+            for key, value in reversed(rows):
+                self.cache[key] = self._loads(value)
+            print(f"加载缓存: {self.size()} 条记录")
         except Exception as e:
-            print(f"保存缓存失败: {e}")
-    
+            print(f"加载缓存失败: {e}")
+            self.cache = OrderedDict()
+
+    def _new_index(self, max_elements: int):
+        """创建空的语义索引：安装了hnswlib时为HNSW，否则为精确内积索引"""
+        if hnswlib is None:
+            return _FlatIndex(self.embedding_dim, max_elements)
+        index = hnswlib.Index(space='cosine', dim=self.embedding_dim)
+        index.init_index(max_elements=max_elements, M=16, ef_construction=200)
+        index.set_ef(64)
+        return index
+
+    def _load_semantic_index(self):
+        """加载（或新建）语义缓存的索引"""
+        vectors = np.zeros((0, self.embedding_dim), dtype=np.float32)
+        if self._vectors_file.exists():
+            try:
+                vectors = np.load(self._vectors_file).astype(np.float32)
+            except Exception as e:
+                print(f"语义缓存向量损坏，重新创建: {e}")
+
+        max_elements = max(self.semantic_max_elements, 2 * len(vectors))
+        self._index = None
+
+        if hnswlib is not None and self._index_file.exists() and len(vectors):
+            try:
+                index = hnswlib.Index(space='cosine', dim=self.embedding_dim)
+                index.load_index(str(self._index_file), max_elements=max_elements)
+                if index.get_current_count() == len(vectors):
+                    index.set_ef(64)
+                    self._index = index
+            except Exception as e:
+                print(f"语义缓存索引损坏，从向量重建: {e}")
+
+        if self._index is None:
+            self._index = self._new_index(max_elements)
+            if len(vectors):
+                self._index.add_items(vectors, np.arange(len(vectors)))
+
+        self._vectors = list(vectors)
+        # 异常退出时未持久化的向量无法找回，解除对应记录的关联
+        self._conn.execute(
+            "UPDATE cache SET embedding_id=NULL WHERE embedding_id >= ?", (len(vectors),)
+        )
+        method = "HNSW" if hnswlib is not None else "精确检索"
+        print(f"语义缓存就绪: {len(self._vectors)} 条向量 (阈值 {self.semantic_threshold}, {method})")
+
+    def save_semantic_index(self):
+        """持久化语义缓存的索引和向量"""
+        if not self.semantic_enabled:
+            return
+        with self._lock:
+            try:
+                vectors = (
+                    np.stack(self._vectors) if self._vectors
+                    else np.zeros((0, self.embedding_dim), dtype=np.float32)
+                )
+                np.save(self._vectors_file, vectors)
+                # 精确索引直接由向量文件重建，无需单独保存
+                if hnswlib is not None:
+                    self._index.save_index(str(self._index_file))
+            except Exception as e:
+                print(f"保存语义缓存失败: {e}")
+
+    def _embed(self, query: str) -> np.ndarray:
+        """计算查询嵌入，复用最近一次的结果"""
+        last_query, last_embedding = self._last_embedding
+        if last_query == query:
+            return last_embedding
+        embedding = np.asarray(self.embedding_fn(query), dtype=np.float32).reshape(-1)
+        self._last_embedding = (query, embedding)
+        return embedding
+
+    def _semantic_get(self, embedding: np.ndarray) -> Optional[Dict]:
+        """在语义索引中查找最相近的已缓存查询（调用方持有_lock）"""
+        if self._index.get_current_count() == 0:
+            return None
+
+        labels, distances = self._index.knn_query(embedding, k=1)
+        similarity = 1.0 - float(distances[0][0])
+        if similarity < self.semantic_threshold:
+            return None
+
+        embedding_id = int(labels[0][0])
+        for result, _, dirty_id in self._dirty.values():
+            if dirty_id == embedding_id:
+                return result
+
+        row = self._conn.execute(
+            "SELECT value FROM cache WHERE embedding_id=?", (embedding_id,)
+        ).fetchone()
+        return self._loads(row[0]) if row else None
+
+    def _semantic_add(self, embedding: np.ndarray) -> int:
+        """将查询嵌入加入语义索引，返回其embedding_id（调用方持有_lock）"""
+        embedding_id = self._index.get_current_count()
+        if embedding_id >= self._index.get_max_elements():
+            self._index.resize_index(2 * self._index.get_max_elements())
+        self._index.add_items(embedding[None, :], [embedding_id])
+        self._vectors.append(embedding)
+        return embedding_id
+
+    def _remember(self, key: str, result: Dict):
+        """写入内存热缓存，超出容量时淘汰最久未使用的条目"""
+        self.cache[key] = result
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    def _flush_loop(self):
+        """后台线程：每隔flush_interval秒或待写入条目过多时批量写入"""
+        while not self._closed:
+            self._flush_event.wait(timeout=self.flush_interval)
+            self._flush_event.clear()
+            self.flush()
+
+    def flush(self):
+        """将待写入的缓存条目批量写入数据库（单个事务）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            items, self._dirty = self._dirty, {}
+            generation = self._generation
+
+        # 序列化不需要持有锁
+        rows = [
+            (key, self._dumps(result), ts, embedding_id)
+            for key, (result, ts, embedding_id) in items.items()
+        ]
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            try:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value, ts, embedding_id) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                print(f"保存缓存失败: {e}")
+
+    def close(self):
+        """停止后台写入线程并写入剩余条目"""
+        if self._closed:
+            return
+        self._closed = True
+        self._flush_event.set()
+        self._flush_thread.join(timeout=5)
+        self.flush()
+
     def get(self, query: str) -> Optional[Dict]:
         """
         获取缓存的查询结果
-        
+        先精确匹配，未命中且启用语义缓存时按语义相似度查找
+
         参数:
             query: 查询文本
-            
+
         返回:
             缓存的结果字典，如果不存在则返回None
         """
-        return self.cache.get(query)
-    
+        key = self._make_key(query)
+
+        with self._lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+            # 已从热缓存淘汰但尚未写入数据库的条目
+            if key in self._dirty:
+                result = self._dirty[key][0]
+                self._remember(key, result)
+                return result
+
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE key=?", (key,)
+            ).fetchone()
+            if row is not None:
+                result = self._loads(row[0])
+                self._remember(key, result)
+                return result
+
+            if not self.semantic_enabled:
+                return None
+
+        # 查询编码是模型前向计算，在锁外进行，锁内只做近邻查找和结果读取
+        embedding = self._embed(query)
+        with self._lock:
+            if not self.semantic_enabled:
+                return None
+            return self._semantic_get(embedding)
+
     def set(self, query: str, result: Dict):
         """
         设置缓存
-        
+
         参数:
             query: 查询文本
             result: 查询结果字典
         """
-        self.cache[query] = result
-        self.save_cache()
-    
+        key = self._make_key(query)
+
+        # 查询编码在锁外进行（get未命中后紧接着set时复用同一嵌入）
+        embedding = None
+        if self.semantic_enabled:
+            try:
+                embedding = self._embed(query)
+            except Exception as e:
+                print(f"更新语义缓存失败: {e}")
+
+        with self._lock:
+            self._remember(key, result)
+            try:
+                embedding_id = None
+                if self.semantic_enabled and embedding is not None:
+                    if key in self._dirty:
+                        embedding_id = self._dirty[key][2]
+                    else:
+                        row = self._conn.execute(
+                            "SELECT embedding_id FROM cache WHERE key=?", (key,)
+                        ).fetchone()
+                        if row and row[0] is not None:
+                            embedding_id = row[0]
+                    if embedding_id is None:
+                        embedding_id = self._semantic_add(embedding)
+            except Exception as e:
+                print(f"更新语义缓存失败: {e}")
+
+            # 数据库写入交给后台线程批量完成
+            self._dirty[key] = (result, time.time(), embedding_id)
+            if len(self._dirty) >= self.flush_batch:
+                self._flush_event.set()
+
     def clear(self):
         """清除所有缓存"""
-        self.cache = {}
-        self.save_cache()
-    
+        with self._lock:
+            self.cache.clear()
+            self._dirty.clear()
+            self._generation += 1
+            self._conn.execute("DELETE FROM cache")
+
+            if self.semantic_enabled:
+                self._index = self._new_index(self.semantic_max_elements)
+                self._vectors = []
+                self._last_embedding = (None, None)
+                self._index_file.unlink(missing_ok=True)
+                self._vectors_file.unlink(missing_ok=True)
+
     def size(self) -> int:
         """
         获取缓存大小
-        
+
         返回:
             缓存中的查询数量
         """
-        return len(self.cache)
+        self.flush()
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class EmbeddingCache:
+    """嵌入缓存 - 按文档块内容哈希持久化嵌入向量，重启或增量更新时复用已有结果"""
+
+    def __init__(self, cache_dir: Path, model_name: str):
+        """
+        初始化嵌入缓存
+
+        参数:
+            cache_dir: 嵌入缓存目录
+            model_name: 嵌入模型名称（不同模型的向量分开存放）
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+
+        prefix = hashlib.sha256(model_name.encode('utf-8')).hexdigest()[:16]
+        # 追加写入: 向量为连续的float32行，键文件每行一个内容哈希
+        self._vectors_file = self.cache_dir / f"{prefix}.f32"
+        self._keys_file = self.cache_dir / f"{prefix}.keys"
+        self._meta_file = self.cache_dir / f"{prefix}.json"
+
+        self.dim = None
+        self._rows: Dict[str, int] = {}  # 内容哈希 -> 行号
+        self._vectors = None
+        self._load()
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        """计算文档块内容的哈希"""
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _load(self):
+        """加载已缓存的嵌入向量"""
+        if not (self._meta_file.exists() and self._keys_file.exists() and self._vectors_file.exists()):
+            return
+        try:
+            meta = orjson.loads(self._meta_file.read_bytes())
+            self.dim = meta["dim"]
+            keys = self._keys_file.read_text(encoding='utf-8').split()
+            vectors = np.fromfile(self._vectors_file, dtype=np.float32).reshape(-1, self.dim)
+            # 异常退出时两个文件可能不一致，以较短者为准
+            count = min(len(keys), len(vectors))
+            self._vectors = vectors[:count]
+            self._rows = {key: row for row, key in enumerate(keys[:count])}
+            print(f"加载嵌入缓存: {count} 个文档块")
+        except Exception as e:
+            print(f"嵌入缓存损坏，重新创建: {e}")
+            self.dim = None
+            self._rows = {}
+            self._vectors = None
+
+    def lookup(self, hashes: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        查找缓存的嵌入向量
+
+        参数:
+            hashes: 文档块内容哈希列表
+
+        返回:
+            与输入对应的向量列表，未命中的位置为None
+        """
+        return [
+            self._vectors[self._rows[h]] if h in self._rows else None
+            for h in hashes
+        ]
+
+    def update(self, hashes: List[str], embeddings: np.ndarray):
+        """
+        追加新的嵌入向量到缓存
+
+        参数:
+            hashes: 文档块内容哈希列表
+            embeddings: 对应的嵌入向量矩阵
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        new = [(h, row) for row, h in enumerate(hashes) if h not in self._rows]
+        if not new:
+            return
+
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+            self._meta_file.write_bytes(
+                orjson.dumps({"model_name": self.model_name, "dim": self.dim})
+            )
+            self._vectors_file.write_bytes(b"")
+            self._keys_file.write_text("", encoding='utf-8')
+
+        new_vectors = embeddings[[row for _, row in new]]
+        try:
+            with open(self._vectors_file, 'ab') as f:
+                f.write(new_vectors.tobytes())
+            with open(self._keys_file, 'a', encoding='utf-8') as f:
+                f.write("".join(f"{h}\n" for h, _ in new))
+        except Exception as e:
+            print(f"保存嵌入缓存失败: {e}")
+            return
+
+        start = len(self._rows)
+        for offset, (h, _) in enumerate(new):
+            self._rows[h] = start + offset
+        self._vectors = (
+            new_vectors if self._vectors is None
+            else np.vstack([self._vectors, new_vectors])
+        )
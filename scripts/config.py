@@ -12,11 +12,22 @@ class RAGConfig:
     DOCUMENTS_DIR = "documents"
     CHUNK_SIZE = 300  # 文档分块大小（字符数）
     CHUNK_OVERLAP = 50  # 分块重叠大小（字符数）
+    CHUNK_WORKERS = None  # 文档分块进程数，None为CPU核数，1表示串行
+    CHUNK_PARALLEL_MIN_DOCUMENTS = 32  # 文档数达到该值才启用多进程分块
+    REBUILD_DEBOUNCE_SECONDS = 0.5  # 上传停顿多久后合并更新索引（秒）
+    REBUILD_MAX_PENDING = 32  # 待索引文件达到该数量时立即更新
+    JOB_TTL_SECONDS = 3600  # 已结束的后台任务记录保留时长（秒）
+    MAX_FINISHED_JOBS = 1000  # 最多保留的已结束任务记录数
     
     CUSTOM_WORDS = CUSTOM_WORDS
     
     # bge-large-zh-v1.5是专为中文优化的高质量嵌入模型
     EMBEDDING_MODEL_NAME = "/path/to/bge-large-zh-v1.5"
+    EMBEDDING_BATCH_SIZE = 64  # 文档块批量编码的批大小
+    EMBEDDING_BACKEND = "torch"  # 推理后端: "torch" | "onnx" | "openvino"（后两者需 sentence-transformers>=3.2 和 optimum）
+    EMBEDDING_ONNX_FILE = None  # ONNX/OpenVINO后端加载的模型文件，如 "onnx/model_O4.onnx"，None为默认文件
+    EMBEDDING_FP16 = True  # 使用GPU时以FP16推理
+    EMBEDDING_QUERY_PROMPT = "为这个句子生成表示以用于检索相关文章："  # 查询指令前缀（注册为模型的"query"提示词）
     #本地部署
     #LLM_API_URL = "/path/to/"
     #调用API
@@ -25,6 +36,18 @@ class RAGConfig:
     # 检索配置
     DEFAULT_TOP_K = 10  # 默认检索返回的文档块数量
     RERANK_TOP_K = 6  # 重排序后返回的文档块数量
+    RERANK_MODEL_NAME = "BAAI/bge-reranker-large"  # 交叉编码器重排序模型，None或加载失败时使用LLM打分
+    RERANK_BATCH_SIZE = 32  # 交叉编码器批量打分的批大小
+    RERANK_CONCURRENCY = 8  # LLM重排序时同时进行的打分请求数
+    RERANK_SKIP_MARGIN = 0.2  # 检索分数第1名与第top_k名相差超过该值时跳过LLM重排序，None为总是重排序
+    RETRIEVAL_INDEX = "auto"  # 向量索引: "flat"暴力检索 | "hnsw" FAISS近似检索（需安装faiss） | "auto"按文档块数量选择
+    HNSW_MIN_CHUNKS = 5000  # "auto"时文档块达到该数量且已安装faiss则使用HNSW，否则暴力检索
+    HNSW_M = 32  # HNSW每个节点的邻居数
+    HNSW_EF_CONSTRUCTION = 200  # HNSW构建时的搜索宽度
+    HNSW_EF_SEARCH = 64  # HNSW查询时的搜索宽度
+    EMBEDDING_QUANT = "fp32"  # 索引向量量化: "fp32" | "sq8"（int8） | "binary"（二值化）；flat下非fp32时扫描量化向量再重新打分（需安装faiss）
+    QUANT_RESCORE_FACTOR = 4  # 量化索引取 top_k×该倍数 个候选，再用FP32向量重新打分
+    INDEX_FILE = "retriever.faiss"  # FAISS索引持久化文件（位于CACHE_DIR下）
     ENABLE_SCORE_DETAILS = True  # 是否启用详细评分信息
     
     # 生成配置
@@ -35,7 +58,24 @@ class RAGConfig:
     
     # 缓存配置
     CACHE_DIR = ".rag_cache"
-    CACHE_FILE = "query_cache.json"
+    CACHE_FILE = "query_cache.db"  # SQLite缓存数据库
+    CACHE_MEMORY_SIZE = 1024  # 内存LRU热缓存的最大条目数
+    CACHE_FLUSH_INTERVAL = 1.0  # 缓存后台批量写入数据库的间隔（秒）
+    CACHE_FLUSH_BATCH = 64  # 待写入条目达到该数量时立即写入
+    EMBEDDING_CACHE_DIR = "embeddings"  # 文档块嵌入缓存子目录（位于CACHE_DIR下）
+    ENABLE_SEMANTIC_CACHE = True  # 是否启用语义缓存（改写后的相同问题也能命中；安装hnswlib时用HNSW索引，否则精确检索）
+    SEMANTIC_CACHE_THRESHOLD = 0.95  # 语义缓存命中的余弦相似度阈值
+    SEMANTIC_CACHE_MAX_ELEMENTS = 10000  # 语义缓存索引初始容量
+    QUERY_EMBEDDING_CACHE_SIZE = 4096  # 查询向量LRU缓存的最大条目数
+    
+    # Web服务配置
+    SERVER_HOST = "0.0.0.0"
+    SERVER_PORT = 4210
+    SERVER_DEV_MODE = True  # 开发模式: 单进程 + 热重载；关闭后以生产模式运行
+    # 生产模式的工作进程数。任务状态和上传索引队列保存在各进程内存中，
+    # 多进程时每个进程各自加载模型和索引，且任务状态查询可能落到其他进程，
+    # 仅在以问答为主的只读部署中调大（如 max(2, CPU核数-1)）
+    SERVER_WORKERS = 1
     
     
     @classmethod
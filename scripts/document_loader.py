@@ -1,20 +1,37 @@
 import os
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple, Iterator
 from pathlib import Path
 from tqdm import tqdm
 
+try:
+    import chardet
+except ImportError:  # 未安装chardet时按固定顺序尝试编码
+    chardet = None
+
 
 class DocumentLoader:
     """文档加载器类"""
     
-    def __init__(self, documents_dir: str = "documents"):
+    # 支持的文件扩展名
+    supported_extensions = frozenset(['.txt', '.md', '.py', '.json', '.csv', '.log'])
+    
+    # 依次尝试的编码
+    encodings = ['utf-8', 'gbk', 'gb2312', 'latin-1']
+    
+    # 编码检测读取的字节数
+    detect_size = 4096
+    
+    def __init__(self, documents_dir: str = "documents", max_workers: Optional[int] = None):
         """
         初始化文档加载器
         
         参数:
             documents_dir: 文档文件夹路径
+            max_workers: 并行读取文件的线程数，默认 min(32, CPU核数×4)
         """
         self.documents_dir = documents_dir
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
         
         # 如果文档文件夹不存在，创建它
         if not os.path.exists(documents_dir):
@@ -32,26 +49,85 @@ class DocumentLoader:
             文件内容
         """
         try:
-            # 尝试多种编码方式
-            encodings = ['utf-8', 'gbk', 'gb2312', 'latin-1']
+            # 只读取一次原始字节，各编码在内存中尝试解码
+            with open(file_path, 'rb') as f:
+                raw = f.read()
+            
+            # 尝试多种编码方式，检测到的编码优先
+            encodings = self.encodings
+            detected = self._detect_encoding(raw[:self.detect_size])
+            if detected:
+                encodings = [detected] + [e for e in encodings if e != detected]
             
             for encoding in encodings:
                 try:
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        content = f.read()
-                    return content
-                except UnicodeDecodeError:
+                    # 与文本模式读取保持一致，统一换行符
+                    return raw.decode(encoding).replace('\r\n', '\n').replace('\r', '\n')
+                except (UnicodeDecodeError, LookupError):
                     continue
             
-            # 如果所有编码都失败，使用二进制模式读取
-            with open(file_path, 'rb') as f:
-                content = f.read().decode('utf-8', errors='ignore')
-            return content
+            # 如果所有编码都失败，忽略无法解码的字节
+            return raw.decode('utf-8', errors='ignore')
             
         except Exception as e:
             print(f"\n加载文件失败 {file_path}: {str(e)}")
             return ""
     
+    def _detect_encoding(self, head: bytes) -> Optional[str]:
+        """
+        根据文件开头的字节检测编码（需要chardet）
+        
+        参数:
+            head: 文件开头的字节
+            
+        返回:
+            检测到的编码名称，无法检测时返回None
+        """
+        if chardet is None:
+            return None
+        
+        # 纯ASCII按utf-8处理
+        if head.isascii():
+            return 'utf-8'
+        
+        encoding = chardet.detect(head).get('encoding')
+        return encoding.lower() if encoding else None
+    
+    def _scan(self, dirpath: str) -> Iterator[os.DirEntry]:
+        """
+        递归遍历文件夹，逐个返回文件条目（不跟随符号链接目录）
+        
+        参数:
+            dirpath: 文件夹路径
+            
+        返回:
+            文件的DirEntry迭代器
+        """
+        with os.scandir(dirpath) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._scan(entry.path)
+                elif entry.is_file():
+                    yield entry
+    
+    def _is_supported(self, name: str) -> bool:
+        """判断文件名的扩展名是否受支持"""
+        dot = name.rfind('.')
+        return dot > 0 and name[dot:].lower() in self.supported_extensions
+    
+    def _load_one(self, file_path: str) -> Tuple[str, str]:
+        """
+        加载单个文件并计算其相对路径
+        
+        参数:
+            file_path: 文件路径
+            
+        返回:
+            (相对路径, 文件内容)
+        """
+        relative_path = os.path.relpath(file_path, self.documents_dir)
+        return relative_path, self.load_text_file(file_path)
+    
     def load_all_documents(self) -> List[Dict[str, str]]:
         """
         从文档文件夹加载所有支持的文档
@@ -61,35 +137,28 @@ class DocumentLoader:
         """
         documents = []
         
-        # 支持的文件扩展名
-        supported_extensions = ['.txt', '.md', '.py', '.json', '.csv', '.log']
-        
         # 遍历文档文件夹并收集所有支持的文件
         if not os.path.exists(self.documents_dir):
             print(f"警告：文档文件夹 '{self.documents_dir}' 不存在")
             return documents
         
         # 先收集所有符合条件的文件路径
-        supported_files = []
-        for root, dirs, files in os.walk(self.documents_dir):
-            for file in files:
-                file_ext = os.path.splitext(file)[1].lower()
-                if file_ext in supported_extensions:
-                    file_path = os.path.join(root, file)
-                    supported_files.append(file_path)
-        
-        # 使用进度条加载文件
+        supported_files = [
+            entry.path for entry in self._scan(self.documents_dir)
+            if self._is_supported(entry.name)
+        ]
+        
+        # 使用线程池并行读取文件（结果保持原顺序）
         print(f"\n开始加载 {len(supported_files)} 个文档...")
-        for file_path in tqdm(supported_files, desc="加载文档", unit="个"):
-            content = self.load_text_file(file_path)
-            
-            if content.strip():  # 只添加非空文档
-                # 使用相对路径作为标题
-                relative_path = os.path.relpath(file_path, self.documents_dir)
-                documents.append({
-                    "title": relative_path,
-                    "content": content
-                })
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(self._load_one, supported_files)
+            for relative_path, content in tqdm(results, total=len(supported_files), desc="加载文档", unit="个"):
+                if content.strip():  # 只添加非空文档
+                    # 使用相对路径作为标题
+                    documents.append({
+                        "title": relative_path,
+                        "content": content
+                    })
         
         print(f"总共成功加载了 {len(documents)} 个文档")
         return documents
@@ -111,18 +180,14 @@ class DocumentLoader:
             return stats
         
         # 收集所有文件以显示进度
-        all_files = []
-        for root, dirs, files in os.walk(self.documents_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                all_files.append(file_path)
+        all_files = list(self._scan(self.documents_dir))
         
         # 显示统计进度
-        for file_path in tqdm(all_files, desc="统计文件", unit="个"):
-            file_ext = os.path.splitext(file_path)[1].lower()
+        for entry in tqdm(all_files, desc="统计文件", unit="个"):
+            file_ext = os.path.splitext(entry.name)[1].lower()
             
             stats["total_files"] += 1
-            stats["total_size"] += os.path.getsize(file_path)
+            stats["total_size"] += entry.stat(follow_symlinks=False).st_size
             
             if file_ext in stats["file_types"]:
                 stats["file_types"][file_ext] += 1
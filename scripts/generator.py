@@ -1,9 +1,25 @@
 """
 生成模块 - 基于检索结果生成答案
 """
+import asyncio
 from typing import List, Dict, Optional
 
 
+# 上下文开头的分隔线
+_CONTEXT_HEADER = "\n\n" + "=" * 50
+
+# 单个文档块的格式化模板
+_CHUNK_TEMPLATE = """【文档片段 {index}】
+来源: {title}
+位置: 第 {position}/{total_chunks} 段
+相关度: {score:.2%}
+内容:
+{content}"""
+
+# 引用来源前缀
+_CITATION_PREFIX = "\n\n---\n**参考来源**: "
+
+
 class AnswerGenerator:
     """答案生成器 - 基于检索到的文档块生成高质量回答"""
     
@@ -49,15 +65,7 @@ class AnswerGenerator:
         if not context_chunks:
             return self._generate_no_context_response(query)
         
-        # 构建结构化上下文文本
-        context_text = self._build_structured_context(context_chunks)
-        
-        # 构建增强的生成提示词
-        prompt = self._build_enhanced_prompt(
-            query=query,
-            context=context_text,
-            custom_instruction=custom_instruction
-        )
+        prompt = self._build_prompt(query, context_chunks, custom_instruction)
         
         # 调用LLM生成回答
         try:
@@ -66,48 +74,106 @@ class AnswerGenerator:
                 max_tokens=self.max_tokens,
                 temperature=self.temperature
             )
+            return self._postprocess(answer, context_chunks)
             
-            # 后处理：添加引用信息
-            if self.enable_citation and answer:
-                answer = self._add_citations(answer, context_chunks)
-            
-            return answer.strip()
+        except Exception as e:
+            print(f"生成回答时出错: {str(e)}")
+            return f"抱歉，生成回答时遇到问题：{str(e)}"
+    
+    async def agenerate(
+        self, 
+        query: str, 
+        context_chunks: List[Dict],
+        custom_instruction: Optional[str] = None
+    ) -> str:
+        """
+        异步生成回答（参数与返回值同generate）
+        客户端不支持agenerate时在线程池中执行同步generate，不阻塞事件循环
+        """
+        if not context_chunks:
+            return self._generate_no_context_response(query)
+        
+        prompt = self._build_prompt(query, context_chunks, custom_instruction)
+        
+        try:
+            kwargs = dict(prompt=prompt, max_tokens=self.max_tokens, temperature=self.temperature)
+            agenerate = getattr(self.llm_client, "agenerate", None)
+            if agenerate is not None:
+                answer = await agenerate(**kwargs)
+            else:
+                answer = await asyncio.to_thread(self.llm_client.generate, **kwargs)
+            return self._postprocess(answer, context_chunks)
             
         except Exception as e:
             print(f"生成回答时出错: {str(e)}")
             return f"抱歉，生成回答时遇到问题：{str(e)}"
     
-    def _build_structured_context(self, context_chunks: List[Dict]) -> str:
+    def _build_prompt(
+        self, 
+        query: str, 
+        context_chunks: List[Dict],
+        custom_instruction: Optional[str]
+    ) -> str:
         """
-        构建结构化的上下文文本
+        由问题和文档块构建完整的生成提示词
         
         参数:
+            query: 用户问题
             context_chunks: 文档块列表
+            custom_instruction: 自定义生成指令
             
         返回:
-            格式化的上下文文本，包含文档来源和相关度信息
+            提示词字符串
         """
-        context_parts = []
+        # 构建结构化上下文文本
+        context_text = self._build_structured_context(context_chunks)
         
-        for i, chunk in enumerate(context_chunks, 1):
-            # 提取文档元信息
-            title = chunk.get('title', '未知文档')
-            content = chunk.get('content', '')
-            score = chunk.get('score', 0.0)
-            chunk_index = chunk.get('chunk_index', 0)
-            total_chunks = chunk.get('total_chunks', 1)
+        # 构建增强的生成提示词
+        return self._build_enhanced_prompt(
+            query=query,
+            context=context_text,
+            custom_instruction=custom_instruction
+        )
+    
+    def _postprocess(self, answer: str, context_chunks: List[Dict]) -> str:
+        """
+        回答后处理：添加引用信息并去除首尾空白
+        
+        参数:
+            answer: LLM生成的原始回答
+            context_chunks: 使用的文档块
             
-            # 构建单个文档块的格式化文本
-            context_part = f"""【文档片段 {i}】
-来源: {title}
-位置: 第 {chunk_index + 1}/{total_chunks} 段
-相关度: {score:.2%}
-内容:
-{content}"""
+        返回:
+            处理后的回答
+        """
+        if self.enable_citation and answer:
+            answer = self._add_citations(answer, context_chunks)
+        
+        return answer.strip()
+    
+    def _build_structured_context(self, context_chunks: List[Dict]) -> str:
+        """
+        构建结构化的上下文文本
+        
+        参数:
+            context_chunks: 文档块列表
             
-            context_parts.append(context_part)
+        返回:
+            格式化的上下文文本，包含文档来源和相关度信息
+        """
+        context_parts = (
+            _CHUNK_TEMPLATE.format(
+                index=i,
+                title=chunk.get('title', '未知文档'),
+                position=chunk.get('chunk_index', 0) + 1,
+                total_chunks=chunk.get('total_chunks', 1),
+                score=chunk.get('score', 0.0),
+                content=chunk.get('content', '')
+            )
+            for i, chunk in enumerate(context_chunks, 1)
+        )
         
-        return "\n\n" + "=" * 50 + "\n\n".join(context_parts)
+        return _CONTEXT_HEADER + "\n\n".join(context_parts)
     
     def _build_enhanced_prompt(
         self, 
@@ -195,20 +261,12 @@ class AnswerGenerator:
         返回:
             添加了引用信息的回答
         """
-        # 提取唯一的文档来源
-        sources = []
-        seen_titles = set()
-        
-        for chunk in context_chunks:
-            title = chunk.get('title', '未知文档')
-            if title not in seen_titles:
-                sources.append(title)
-                seen_titles.add(title)
+        # 提取唯一的文档来源（dict保持插入顺序，按首次出现排序去重）
+        sources = dict.fromkeys(chunk.get('title', '未知文档') for chunk in context_chunks)
         
         # 如果回答中还没有来源信息，添加引用
         if sources and "来源" not in answer and "参考" not in answer:
-            citation = "\n\n---\n**参考来源**: " + "、".join(sources)
-            return answer + citation
+            return "".join([answer, _CITATION_PREFIX, "、".join(sources)])
         
         return answer
     
@@ -244,6 +302,28 @@ class AnswerGenerator:
             "followup_questions": followup_questions
         }
     
+    async def agenerate_with_followup(
+        self, 
+        query: str, 
+        context_chunks: List[Dict],
+        conversation_history: Optional[List[Dict]] = None
+    ) -> Dict[str, str]:
+        """
+        异步生成回答并提供后续问题建议（参数与返回值同generate_with_followup）
+        """
+        answer = await self.agenerate(query, context_chunks)
+        
+        followup_questions = self._generate_followup_questions(
+            query, 
+            context_chunks, 
+            answer
+        )
+        
+        return {
+            "answer": answer,
+            "followup_questions": followup_questions
+        }
+    
     def _generate_followup_questions(
         self, 
         query: str, 
@@ -1,87 +1,296 @@
 """
 知识图谱生成模块 - 从文档中提取实体和关系，生成可视化知识图谱
 """
-from typing import List, Dict, Tuple, Set
+from typing import List, Dict, Tuple, Set, Optional, Iterable, FrozenSet
+import os
 import re
+import bisect
+import sys
+import functools
+import gzip
 from collections import defaultdict, Counter
+import ahocorasick
+import jieba
 import jieba.posseg as pseg
 import networkx as nx
-from pyvis.network import Network
+import orjson
 from pathlib import Path
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
+
+
+# 不跨越句子和逗号的文本片段（非贪婪 / 贪婪）
+_CLAUSE = r'[^。！？；\n,，]+?'
+_CLAUSE_TAIL = r'[^。！？；\n,，]+'
+
+# 自定义词在jieba词典中的词频（与TextProcessor一致）
+_CUSTOM_WORD_FREQ = 10000
+
+
+@functools.lru_cache(maxsize=100_000)
+def _pos_tag(text: str) -> Tuple[Tuple[str, str], ...]:
+    """
+    对实体间的短片段做词性标注（不使用HMM）
+    "的"、"与"、"和其"这类片段在全书中大量重复，结果直接缓存
+
+    参数:
+        text: 短文本片段
+
+    返回:
+        ((词, 词性), ...)
+    """
+    return tuple((word, flag) for word, flag in pseg.lcut(text, HMM=False))
+
+
+# 交互式图谱网页模板：节点、边和配置以JSON直接写入，浏览器端由vis-network渲染
+_GRAPH_HTML_TEMPLATE = """<html>
+<head>
+    <meta charset="utf-8">
+    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/dist/vis-network.min.css" integrity="sha512-WgxfT5LWjfszlPHXRmBWHkV2eceiWTOBvrKCNbdgDYTHrT2AeLCGbF4sZlZw3UMN3WtL0tGUoIAKsu8mllg/XA==" crossorigin="anonymous" referrerpolicy="no-referrer" />
+    <script src="https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/vis-network.min.js" integrity="sha512-LnvoEWDFrqGHlHmDD2101OrLcbsfkrzoSpvtSQtxK3RMnRV0eOkhhBN2dXHKRrUU8p2DGRTk35n4O8nWSVe1mQ==" crossorigin="anonymous" referrerpolicy="no-referrer"></script>
+    <style type="text/css">
+        body {
+            margin: 0;
+            padding: 0;
+            font-family: 'Microsoft YaHei', 'SimHei', Arial, sans-serif;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        }
+        #header {
+            background: rgba(255, 255, 255, 0.95);
+            padding: 20px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+            text-align: center;
+        }
+        #header h1 {
+            margin: 0;
+            color: #2c3e50;
+            font-size: 28px;
+            font-weight: bold;
+        }
+        #header p {
+            margin: 10px 0 0 0;
+            color: #7f8c8d;
+            font-size: 14px;
+        }
+        #stats {
+            display: inline-block;
+            margin-top: 10px;
+            padding: 8px 16px;
+            background: #ecf0f1;
+            border-radius: 20px;
+            font-size: 13px;
+            color: #34495e;
+        }
+        #legend {
+            position: absolute;
+            top: 140px;
+            right: 20px;
+            background: rgba(255, 255, 255, 0.95);
+            padding: 15px;
+            border-radius: 8px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.15);
+            z-index: 1000;
+            max-width: 240px;
+        }
+        #legend h3 {
+            margin: 0 0 10px 0;
+            color: #2c3e50;
+            font-size: 16px;
+        }
+        .legend-item {
+            display: flex;
+            align-items: center;
+            margin: 8px 0;
+            font-size: 13px;
+        }
+        .legend-color {
+            width: 20px;
+            height: 20px;
+            border-radius: 50%;
+            margin-right: 10px;
+            border: 2px solid #2c3e50;
+        }
+        #mynetwork {
+            height: 950px;
+            background-color: #f8f9fa;
+            border: 1px solid lightgray;
+            position: relative;
+            border-radius: 8px;
+            margin: 20px;
+            box-shadow: 0 4px 20px rgba(0,0,0,0.2);
+        }
+    </style>
+</head>
+<body>
+    <div id="header">
+        <h1>🔍 知识图谱可视化</h1>
+        <p>展示文档中的实体关系网络 | 鼠标滚轮缩放 | 拖拽节点调整位置 | 悬停查看详细关系</p>
+        <div id="stats">
+            📊 显示 <strong>__DISPLAY_COUNT__</strong> / __TOTAL_COUNT__ 个高频实体
+        </div>
+    </div>
+    <div id="legend">
+        <h3>📊 图例说明</h3>
+        <div class="legend-item">
+            <div class="legend-color" style="background: #8e44ad;"></div>
+            <span>自定义实体（高频）</span>
+        </div>
+        <div class="legend-item">
+            <div class="legend-color" style="background: #9b59b6;"></div>
+            <span>自定义实体（低频）</span>
+        </div>
+        <div class="legend-item">
+            <div class="legend-color" style="background: #3498db;"></div>
+            <span>普通实体（低频）</span>
+        </div>
+        <div class="legend-item">
+            <div class="legend-color" style="background: #f39c12;"></div>
+            <span>普通实体（中频）</span>
+        </div>
+        <div class="legend-item">
+            <div class="legend-color" style="background: #e74c3c;"></div>
+            <span>普通实体（高频）</span>
+        </div>
+        <div style="margin-top: 15px; padding-top: 15px; border-top: 1px solid #ecf0f1; font-size: 12px; color: #7f8c8d;">
+            <strong>提示：</strong><br>
+            • 节点大小 = 出现频率<br>
+            • 边的粗细 = 关系强度<br>
+            • 边标签 = 关系类型<br>
+            • 悬停边查看上下文<br>
+            • 支持多选和搜索
+        </div>
+    </div>
+    <div id="mynetwork"></div>
+    <script type="text/javascript">
+        __GRAPH_DATA__
+        var container = document.getElementById('mynetwork');
+        var network = new vis.Network(container, {nodes: nodes, edges: edges}, options);
+    </script>
+</body>
+</html>
+"""
 
 
 class KnowledgeGraphBuilder:
     """知识图谱构建器 - 提取实体、识别关系、生成可视化图谱"""
 
-    def __init__(self, custom_words: List[str] = None):
+    # 文档数少于该值时串行处理，避免进程池启动开销
+    parallel_min_documents = 8
+
+    def __init__(self, custom_words: List[str] = None, max_workers: Optional[int] = None):
         """
         初始化知识图谱构建器
 
         参数:
             custom_words: 自定义词典（领域专有名词，如"唐门"、"唐三"等）
+            max_workers: 并行提取实体和关系的进程数，默认为CPU核数，1表示串行
         """
-        self.custom_words = set(custom_words or [])
+        # 实体字符串统一驻留（sys.intern），在集合、计数器、关系和图节点间共享同一对象
+        self.custom_words = {sys.intern(word) for word in custom_words or []}
+        # 自定义词加入jieba词典（与TextProcessor一致），工作进程和独立的图谱构建进程同样生效
+        # 已以相同词频注册的词跳过：add_word每次都会累加词典总频次，重复注册会改变分词结果
+        new_words = [word for word in self.custom_words if jieba.dt.FREQ.get(word) != _CUSTOM_WORD_FREQ]
+        for word in new_words:
+            jieba.add_word(word, freq=_CUSTOM_WORD_FREQ)
+        if new_words:
+            _pos_tag.cache_clear()  # 词典变化后旧的标注结果失效
+        self.max_workers = max_workers or os.cpu_count() or 1
         self.entities = set()  # 所有实体
         self.relations = []  # 所有关系 (实体1, 关系类型, 实体2)
         self.entity_frequency = Counter()  # 实体出现频率
         self.relation_details = defaultdict(list)  # 关系详细信息
+        self.relation_type_counts = Counter()  # 关系类型计数（构建图谱时更新）
         self.graph = nx.DiGraph()  # 有向图
 
-        self.relation_patterns = [
+        # 多模式匹配自动机：自定义词典在初始化时构建，全部实体在实体提取后构建
+        self._custom_automaton = self._build_automaton(self.custom_words)
+        self._entity_automaton = None
+
+        # 关系模式在初始化时预编译，避免每个文档重复查找正则缓存
+        # 实体部分限定在单个分句内，遇到标点即停止匹配，避免跨句大范围回溯
+        self.relation_patterns = [(re.compile(pattern), relation_type) for pattern, relation_type in [
             # 身份关系
-            (r'(.+?)是(.+?)的(.+)', '身份'),
-            (r'(.+?)担任(.+)', '担任'),
-            (r'(.+?)成为(.+)', '成为'),
+            (rf'({_CLAUSE})是({_CLAUSE})的({_CLAUSE_TAIL})', '身份'),
+            (rf'({_CLAUSE})担任({_CLAUSE_TAIL})', '担任'),
+            (rf'({_CLAUSE})成为({_CLAUSE_TAIL})', '成为'),
             
             # 归属关系
-            (r'(.+?)属于(.+)', '属于'),
-            (r'(.+?)来自(.+)', '来自'),
-            (r'(.+?)出身(.+)', '出身'),
+            (rf'({_CLAUSE})属于({_CLAUSE_TAIL})', '属于'),
+            (rf'({_CLAUSE})来自({_CLAUSE_TAIL})', '来自'),
+            (rf'({_CLAUSE})出身({_CLAUSE_TAIL})', '出身'),
             
             # 位置关系
-            (r'(.+?)位于(.+)', '位于'),
-            (r'(.+?)在(.+?)中', '位于'),
+            (rf'({_CLAUSE})位于({_CLAUSE_TAIL})', '位于'),
+            (rf'({_CLAUSE})在({_CLAUSE})中', '位于'),
             
             # 拥有关系
-            (r'(.+?)拥有(.+)', '拥有'),
-            (r'(.+?)获得(.+)', '获得'),
-            (r'(.+?)得到(.+)', '得到'),
+            (rf'({_CLAUSE})拥有({_CLAUSE_TAIL})', '拥有'),
+            (rf'({_CLAUSE})获得({_CLAUSE_TAIL})', '获得'),
+            (rf'({_CLAUSE})得到({_CLAUSE_TAIL})', '得到'),
             
             # 技能关系
-            (r'(.+?)使用(.+)', '使用'),
-            (r'(.+?)施展(.+)', '施展'),
-            (r'(.+?)掌握(.+)', '掌握'),
-            (r'(.+?)修炼(.+)', '修炼'),
-            (r'(.+?)学习(.+)', '学习'),
+            (rf'({_CLAUSE})使用({_CLAUSE_TAIL})', '使用'),
+            (rf'({_CLAUSE})施展({_CLAUSE_TAIL})', '施展'),
+            (rf'({_CLAUSE})掌握({_CLAUSE_TAIL})', '掌握'),
+            (rf'({_CLAUSE})修炼({_CLAUSE_TAIL})', '修炼'),
+            (rf'({_CLAUSE})学习({_CLAUSE_TAIL})', '学习'),
             
             # 教学关系
-            (r'(.+?)教导(.+)', '教导'),
-            (r'(.+?)指导(.+)', '指导'),
-            (r'(.+?)传授(.+)', '传授'),
+            (rf'({_CLAUSE})教导({_CLAUSE_TAIL})', '教导'),
+            (rf'({_CLAUSE})指导({_CLAUSE_TAIL})', '指导'),
+            (rf'({_CLAUSE})传授({_CLAUSE_TAIL})', '传授'),
             
             # 战斗关系
-            (r'(.+?)击败(.+)', '击败'),
-            (r'(.+?)战胜(.+)', '战胜'),
-            (r'(.+?)对战(.+)', '对战'),
-            (r'(.+?)挑战(.+)', '挑战'),
-            (r'(.+?)攻击(.+)', '攻击'),
+            (rf'({_CLAUSE})击败({_CLAUSE_TAIL})', '击败'),
+            (rf'({_CLAUSE})战胜({_CLAUSE_TAIL})', '战胜'),
+            (rf'({_CLAUSE})对战({_CLAUSE_TAIL})', '对战'),
+            (rf'({_CLAUSE})挑战({_CLAUSE_TAIL})', '挑战'),
+            (rf'({_CLAUSE})攻击({_CLAUSE_TAIL})', '攻击'),
             
             # 社交关系
-            (r'(.+?)帮助(.+)', '帮助'),
-            (r'(.+?)认识(.+)', '认识'),
-            (r'(.+?)遇见(.+)', '遇见'),
-            (r'(.+?)跟随(.+)', '跟随'),
-            (r'(.+?)保护(.+)', '保护'),
-            (r'(.+?)和(.+?)是(.+)', '关系'),
-            (r'(.+?)与(.+?)(.+)', '关联'),
+            (rf'({_CLAUSE})帮助({_CLAUSE_TAIL})', '帮助'),
+            (rf'({_CLAUSE})认识({_CLAUSE_TAIL})', '认识'),
+            (rf'({_CLAUSE})遇见({_CLAUSE_TAIL})', '遇见'),
+            (rf'({_CLAUSE})跟随({_CLAUSE_TAIL})', '跟随'),
+            (rf'({_CLAUSE})保护({_CLAUSE_TAIL})', '保护'),
+            (rf'({_CLAUSE})和({_CLAUSE})是({_CLAUSE_TAIL})', '关系'),
+            (rf'({_CLAUSE})与({_CLAUSE})({_CLAUSE_TAIL})', '关联'),
             
             # 创造关系
-            (r'(.+?)创建(.+)', '创建'),
-            (r'(.+?)建立(.+)', '建立'),
-            (r'(.+?)制作(.+)', '制作'),
+            (rf'({_CLAUSE})创建({_CLAUSE_TAIL})', '创建'),
+            (rf'({_CLAUSE})建立({_CLAUSE_TAIL})', '建立'),
+            (rf'({_CLAUSE})制作({_CLAUSE_TAIL})', '制作'),
+        ]]
+
+        # 各模式在分组之外的字面量（如"是"和"的"、"位于"），文本中缺少任意一个时该模式不可能匹配
+        self._pattern_triggers = [
+            tuple(literal for literal in re.split(r'\([^)]*\)', pattern.pattern) if literal)
+            for pattern, _ in self.relation_patterns
         ]
 
+        # 分句用的正则
+        self._sentence_splitter = re.compile(r'[。！？；\n]+')
+
+    @staticmethod
+    def _build_automaton(words) -> "ahocorasick.Automaton":
+        """
+        构建Aho-Corasick自动机，一次扫描即可找出文本中出现的所有词
+
+        参数:
+            words: 词集合
+
+        返回:
+            自动机（未添加任何词时为None）
+        """
+        automaton = ahocorasick.Automaton()
+        for word in words:
+            if word:
+                automaton.add_word(word, word)
+        if len(automaton) == 0:
+            return None
+        automaton.make_automaton()
+        return automaton
+
     def extract_entities(self, text: str) -> List[str]:
         """
         从文本中提取实体，优先识别自定义词典中的专有名词
@@ -94,15 +303,14 @@ class KnowledgeGraphBuilder:
         """
         entities = []
         
-        for custom_word in self.custom_words:
-            if custom_word in text:
-                # 计算出现次数
-                count = text.count(custom_word)
-                entities.extend([custom_word] * count)
-                self.entity_frequency[custom_word] += count
+        # 一次扫描找出所有自定义词及其出现次数
+        if self._custom_automaton is not None:
+            for _, custom_word in self._custom_automaton.iter(text):
+                entities.append(custom_word)
+                self.entity_frequency[custom_word] += 1
         
-        # 使用jieba分词提取其他实体
-        words_with_pos = pseg.cut(text)
+        # 使用jieba分词提取其他实体（保留HMM以识别词典外的人名、地名）
+        words_with_pos = pseg.lcut(text)
 
         for word, flag in words_with_pos:
             # 跳过已经在自定义词典中的词
@@ -112,32 +320,53 @@ class KnowledgeGraphBuilder:
             # nr: 人名, ns: 地名, nt: 机构名, nz: 其他专名
             if flag in ['nr', 'ns', 'nt', 'nz']:
                 if len(word) >= 2:  # 至少2个字符
+                    word = sys.intern(word)
                     entities.append(word)
                     self.entity_frequency[word] += 1
 
         return entities
 
-    def extract_relations(self, text: str, entities: List[str]) -> List[Tuple[str, str, str, str]]:
+    def _count_entities(self, text: str) -> Tuple[List[str], Counter]:
+        """
+        提取实体并单独统计本文本中的实体频率（不累加到全局频率）
+
+        参数:
+            text: 输入文本
+
+        返回:
+            (实体列表, 实体频率)
+        """
+        total_frequency = self.entity_frequency
+        self.entity_frequency = Counter()
+        try:
+            entities = self.extract_entities(text)
+            return entities, self.entity_frequency
+        finally:
+            self.entity_frequency = total_frequency
+
+    def extract_relations(self, text: str, entities: Iterable[str]) -> List[Tuple[str, str, str, str]]:
         """
         从文本中提取实体间的关系，返回详细的关系信息
 
         参数:
             text: 输入文本
-            entities: 已提取的实体列表
+            entities: 文本中的实体（传入frozenset时直接使用，不再重复构建集合）
 
         返回:
             关系四元组列表 [(实体1, 关系, 实体2, 上下文), ...]
         """
         relations = []
-        entity_set = set(entities)
+        entity_set = entities if isinstance(entities, frozenset) else frozenset(entities)
 
-        for pattern, relation_type in self.relation_patterns:
-            matches = re.finditer(pattern, text)
-            for match in matches:
+        for (pattern, relation_type), triggers in zip(self.relation_patterns, self._pattern_triggers):
+            # 先用子串查找排除不含触发词的模式，省去整篇文本的正则扫描
+            if not all(trigger in text for trigger in triggers):
+                continue
+            for match in pattern.finditer(text):
                 groups = match.groups()
                 if len(groups) >= 2:
-                    entity1 = groups[0].strip()
-                    entity2 = groups[1].strip()
+                    entity1 = sys.intern(groups[0].strip())
+                    entity2 = sys.intern(groups[1].strip())
 
                     # 验证是否为有效实体
                     if entity1 in entity_set and entity2 in entity_set:
@@ -148,40 +377,66 @@ class KnowledgeGraphBuilder:
                         
                         relations.append((entity1, relation_type, entity2, context))
 
-        sentences = re.split(r'[。！？；\n]+', text)
-        for sentence in sentences:
-            if len(sentence) < 5:  # 跳过太短的句子
+        # 共现关系：用自动机扫描句子，按出现位置得到实体序列（主进程复用全部实体的自动机）
+        automaton = self._entity_automaton
+        if automaton is None:
+            automaton = self._build_automaton(entity_set)
+        if automaton is None:
+            return relations
+
+        # 由分隔符得到每个句子在全文中的起止位置
+        sent_starts = [0]
+        sent_ends = []
+        for match in self._sentence_splitter.finditer(text):
+            sent_ends.append(match.start())
+            sent_starts.append(match.end())
+        sent_ends.append(len(text))
+
+        # 整篇文本只扫描一次，命中按所在句子分桶，记录每个实体在句中首次出现的位置
+        # （同一实体的命中按位置先后返回，第一次命中即首次出现）
+        buckets = {}
+        for end, entity in automaton.iter(text):
+            if entity not in entity_set:
                 continue
-                
-            sentence_entities = [e for e in entity_set if e in sentence]
-
-            # 如果句子中有2-5个实体，建立共现关系（避免过多实体导致关系爆炸）
-            if 2 <= len(sentence_entities) <= 5:
-                for i in range(len(sentence_entities) - 1):
-                    entity1 = sentence_entities[i]
-                    entity2 = sentence_entities[i + 1]  # 只连接相邻实体
-
-                    # 提取两个实体之间的文本
-                    start_idx = sentence.find(entity1) + len(entity1)
-                    end_idx = sentence.find(entity2)
+            start = end - len(entity) + 1
+            idx = bisect.bisect_right(sent_starts, start) - 1
+            if end >= sent_ends[idx]:  # 跨越句子分隔符
+                continue
+            first_pos = buckets.setdefault(idx, {})
+            if entity not in first_pos:
+                first_pos[entity] = start - sent_starts[idx]
 
-                    if 0 < start_idx < end_idx:
-                        between_text = sentence[start_idx:end_idx].strip()
-                        
-                        words_with_pos = pseg.cut(between_text)
-                        verbs = [w for w, f in words_with_pos if f.startswith('v') and len(w) >= 2]
+        # 只处理含2-5个实体的句子，建立共现关系（避免过多实体导致关系爆炸）
+        for idx, first_pos in buckets.items():
+            if not 2 <= len(first_pos) <= 5:
+                continue
+            sentence = text[sent_starts[idx]:sent_ends[idx]]
+            if len(sentence) < 5:  # 跳过太短的句子
+                continue
 
-                        if verbs:
-                            relation_type = verbs[0]  # 使用第一个动词
+            hits = sorted((pos, entity) for entity, pos in first_pos.items())
+            for (pos1, entity1), (end_idx, entity2) in zip(hits, hits[1:]):  # 只连接相邻实体
+                # 提取两个实体之间的文本（实体重叠时跳过）
+                start_idx = pos1 + len(entity1)
+                if start_idx < end_idx:
+                    between_text = sentence[start_idx:end_idx].strip()
+                    if not between_text:
+                        continue
+                    
+                    words_with_pos = _pos_tag(between_text)
+                    verbs = [w for w, f in words_with_pos if f.startswith('v') and len(w) >= 2]
+
+                    if verbs:
+                        relation_type = verbs[0]  # 使用第一个动词
+                    else:
+                        # 如果没有动词，检查是否有介词或连词
+                        preps = [w for w, f in words_with_pos if f in ['p', 'c']]
+                        if preps and len(between_text) <= 3:
+                            relation_type = preps[0]
                         else:
-                            # 如果没有动词，检查是否有介词或连词
-                            preps = [w for w, f in words_with_pos if f in ['p', 'c']]
-                            if preps and len(between_text) <= 3:
-                                relation_type = preps[0]
-                            else:
-                                continue  # 跳过没有明确关系的共现
+                            continue  # 跳过没有明确关系的共现
 
-                        relations.append((entity1, relation_type, entity2, sentence[:50]))
+                    relations.append((entity1, relation_type, entity2, sentence[:50]))
 
         return relations
 
@@ -198,86 +453,105 @@ class KnowledgeGraphBuilder:
 
         all_entities = []
         all_relations = []
-
-        # 第一步：提取所有实体
-        print("\n正在提取实体（优先识别自定义词典）...")
-        for doc in tqdm(documents, desc="实体提取", ncols=80):
-            content = doc.get('content', '')
-            entities = self.extract_entities(content)
-            all_entities.extend(entities)
-            self.entities.update(entities)
-
-        print(f"✓ 提取到 {len(self.entities)} 个唯一实体")
-        
-        custom_entities_found = [e for e in self.custom_words if e in self.entities]
-        if custom_entities_found:
-            print(f"✓ 识别到 {len(custom_entities_found)} 个自定义词典实体")
-            top_custom = sorted(
-                [(e, self.entity_frequency[e]) for e in custom_entities_found],
-                key=lambda x: x[1],
-                reverse=True
-            )[:10]
-            print(f"  高频自定义实体: {', '.join([f'{e}({c})' for e, c in top_custom])}")
-
-        # 第二步：提取关系
-        print("\n正在提取实体关系...")
-        for doc in tqdm(documents, desc="关系提取", ncols=80):
-            content = doc.get('content', '')
-            doc_entities = [e for e in self.entities if e in content]
-            relations = self.extract_relations(content, doc_entities)
-            all_relations.extend(relations)
-
-        relation_dict = {}
+        contents = [doc.get('content', '') for doc in documents]
+
+        # 各文档相互独立，文档较多时用多进程并行提取
+        workers = max(1, min(self.max_workers, len(contents)))
+        executor = None
+        if workers > 1 and len(contents) >= self.parallel_min_documents:
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(sorted(self.custom_words),)
+            )
+            print(f"使用 {workers} 个进程并行提取")
+        chunksize = max(1, min(16, len(contents) // (workers * 4)))
+
+        try:
+            # 第一步：提取所有实体
+            print("\n正在提取实体（优先识别自定义词典）...")
+            if executor:
+                entity_results = executor.map(_count_entities_job, contents, chunksize=chunksize)
+            else:
+                entity_results = map(self._count_entities, contents)
+            for entities, frequency in tqdm(entity_results, total=len(contents), desc="实体提取", ncols=80):
+                # 工作进程返回的字符串经过反序列化，需在主进程重新驻留
+                entities = [sys.intern(entity) for entity in entities]
+                all_entities.extend(entities)
+                self.entities.update(entities)
+                for entity, count in frequency.items():
+                    self.entity_frequency[sys.intern(entity)] += count
+
+            print(f"✓ 提取到 {len(self.entities)} 个唯一实体")
+
+            custom_entities_found = [e for e in self.custom_words if e in self.entities]
+            if custom_entities_found:
+                print(f"✓ 识别到 {len(custom_entities_found)} 个自定义词典实体")
+                top_custom = sorted(
+                    [(e, self.entity_frequency[e]) for e in custom_entities_found],
+                    key=lambda x: x[1],
+                    reverse=True
+                )[:10]
+                print(f"  高频自定义实体: {', '.join([f'{e}({c})' for e, c in top_custom])}")
+
+            # 第二步：提取关系
+            print("\n正在提取实体关系...")
+            self._entity_automaton = self._build_automaton(self.entities)
+            doc_entities = [
+                frozenset(entity for _, entity in self._entity_automaton.iter(content))
+                if self._entity_automaton is not None else frozenset()
+                for content in contents
+            ]
+            if executor:
+                relation_results = executor.map(
+                    _extract_relations_job, contents, doc_entities, chunksize=chunksize
+                )
+            else:
+                relation_results = map(self.extract_relations, contents, doc_entities)
+            for relations in tqdm(relation_results, total=len(contents), desc="关系提取", ncols=80):
+                all_relations.extend(relations)
+        finally:
+            if executor:
+                executor.shutdown()
+
+        relation_dict = defaultdict(list)
         for entity1, relation, entity2, context in all_relations:
-            key = (entity1, relation, entity2)
-            if key not in relation_dict:
-                relation_dict[key] = []
-            relation_dict[key].append(context)
+            relation_dict[(sys.intern(entity1), sys.intern(relation), sys.intern(entity2))].append(context)
         
         self.relations = list(relation_dict.keys())
         self.relation_details = relation_dict
 
         print(f"✓ 提取到 {len(self.relations)} 个唯一关系")
         
-        relation_types = Counter([r[1] for r in self.relations])
-        print(f"✓ 关系类型统计: {dict(relation_types.most_common(10))}")
+        self.relation_type_counts = Counter(r[1] for r in self.relations)
+        print(f"✓ 关系类型统计: {dict(self.relation_type_counts.most_common(10))}")
 
-        # 第三步：构建图结构
+        # 第三步：构建图结构（先在普通字典中汇总节点和边属性，再批量写入图）
         print("\n正在构建图结构...")
-        for entity1, relation, entity2 in tqdm(self.relations, desc="构建图谱", ncols=80):
-            # 添加节点
-            if not self.graph.has_node(entity1):
-                self.graph.add_node(
-                    entity1,
-                    frequency=self.entity_frequency[entity1],
-                    type='custom' if entity1 in self.custom_words else 'entity'
-                )
-
-            if not self.graph.has_node(entity2):
-                self.graph.add_node(
-                    entity2,
-                    frequency=self.entity_frequency[entity2],
-                    type='custom' if entity2 in self.custom_words else 'entity'
-                )
-
-            # 添加边（关系）
-            key = (entity1, relation, entity2)
-            contexts = self.relation_details[key]
-            
-            if self.graph.has_edge(entity1, entity2):
-                # 如果边已存在，合并关系
-                self.graph[entity1][entity2]['weight'] += 1
-                self.graph[entity1][entity2]['relations'].append(relation)
-                self.graph[entity1][entity2]['contexts'].extend(contexts)
-            else:
-                self.graph.add_edge(
-                    entity1,
-                    entity2,
-                    relation=relation,
-                    weight=1,
-                    relations=[relation],
-                    contexts=contexts
-                )
+        # 同一对实体间的多个关系合并为一条边：每条关系只需一次字典查找
+        edge_agg = defaultdict(lambda: {'weight': 0, 'relations': [], 'contexts': []})
+        for (entity1, relation, entity2), contexts in tqdm(
+            self.relation_details.items(), total=len(self.relations), desc="构建图谱", ncols=80
+        ):
+            agg = edge_agg[(entity1, entity2)]
+            agg['weight'] += 1
+            agg['relations'].append(relation)
+            agg['contexts'].extend(contexts)
+
+        # 节点按首次出现的顺序添加
+        nodes = dict.fromkeys(entity for edge in edge_agg for entity in edge)
+        self.graph.add_nodes_from(
+            (entity, {
+                'frequency': self.entity_frequency[entity],
+                'type': 'custom' if entity in self.custom_words else 'entity'
+            })
+            for entity in nodes
+        )
+        # 边的主关系类型取第一条关系
+        self.graph.add_edges_from(
+            (u, v, {'relation': agg['relations'][0], **agg})
+            for (u, v), agg in edge_agg.items()
+        )
 
         print(f"✓ 图谱构建完成: {self.graph.number_of_nodes()} 个节点, {self.graph.number_of_edges()} 条边")
 
@@ -335,7 +609,7 @@ class KnowledgeGraphBuilder:
 
     def visualize_interactive(self, output_path: str = "knowledge_graph.html", top_n: int=10) -> str:
         """
-        生成交互式知识图谱网页（使用pyvis）- 美化版
+        生成交互式知识图谱网页（vis-network）- 美化版
 
         参数:
             output_path: 输出HTML文件路径
@@ -354,17 +628,7 @@ class KnowledgeGraphBuilder:
         top_entities = [e for e, _ in self.get_top_entities(display_count)]
         subgraph = self.graph.subgraph(top_entities)
 
-        net = Network(
-            height="950px",
-            width="100%",
-            bgcolor="#f8f9fa",
-            font_color="#2c3e50",
-            directed=True,
-            notebook=False,
-            cdn_resources='remote'
-        )
-
-        net.set_options("""
+        options = """
         {
           "physics": {
             "enabled": true,
@@ -464,7 +728,7 @@ class KnowledgeGraphBuilder:
             }
           }
         }
-        """)
+        """
 
         frequencies = [self.entity_frequency[node] for node in subgraph.nodes()]
         max_freq = max(frequencies) if frequencies else 1
@@ -491,6 +755,7 @@ class KnowledgeGraphBuilder:
             else:
                 return '#e74c3c'  # 红色 - 高频
 
+        nodes = []
         for node in subgraph.nodes():
             frequency = self.entity_frequency[node]
             node_color = get_node_color(node, frequency)
@@ -507,12 +772,14 @@ class KnowledgeGraphBuilder:
             title += f"<span style='color:#7f8c8d'>出现次数: {frequency}</span><br>"
             title += "<span style='color:#95a5a6; font-size:12px'>点击查看详情</span>"
             
-            net.add_node(
-                node,
-                label=node,
-                title=title,
-                size=node_size,
-                color={
+            nodes.append({
+                'id': node,
+                'label': node,
+                'title': title,
+                'shape': 'dot',
+                'font': {'color': '#2c3e50'},
+                'size': node_size,
+                'color': {
                     'background': node_color,
                     'border': '#2c3e50' if is_custom else '#34495e',
                     'highlight': {
@@ -524,9 +791,10 @@ class KnowledgeGraphBuilder:
                         'border': '#16a085'
                     }
                 },
-                borderWidth=3 if is_custom else 2
-            )
+                'borderWidth': 3 if is_custom else 2
+            })
 
+        edges = []
         for source, target, data in subgraph.edges(data=True):
             relations = data.get('relations', ['相关'])
             weight = data.get('weight', 1)
@@ -552,25 +820,39 @@ class KnowledgeGraphBuilder:
             
             title += "</div>"
             
-            net.add_edge(
-                source,
-                target,
-                label=relation_str,
-                title=title,
-                width=edge_width,
-                color={
+            edges.append({
+                'from': source,
+                'to': target,
+                'arrows': 'to',
+                'label': relation_str,
+                'title': title,
+                'width': edge_width,
+                'color': {
                     'color': '#95a5a6',
                     'highlight': '#e74c3c',
                     'hover': '#3498db'
                 }
-            )
+            })
+
+        # 节点和边序列化为JSON后一次性写入模板（转义 "</"，避免文本中的标签提前结束脚本）
+        graph_data = b''.join([
+            b'var nodes = new vis.DataSet(', orjson.dumps(nodes).replace(b'</', b'<\\/'), b');\n',
+            b'        var edges = new vis.DataSet(', orjson.dumps(edges).replace(b'</', b'<\\/'), b');\n',
+            b'        var options = ', options.strip().encode('utf-8'), b';'
+        ])
+        html = (
+            _GRAPH_HTML_TEMPLATE
+            .replace('__DISPLAY_COUNT__', str(display_count))
+            .replace('__TOTAL_COUNT__', str(total_entities))
+            .encode('utf-8')
+            .replace(b'__GRAPH_DATA__', graph_data)
+        )
 
         # 保存HTML
         output_path = Path(output_path)
         output_path.parent.mkdir(parents=True, exist_ok=True)
-        net.save_graph(str(output_path))
-
-        self._enhance_html(output_path, display_count, total_entities)
+        output_path.write_bytes(html)
+        self._write_gzip(output_path, html)
 
         print(f"✓ 交互式图谱已保存: {output_path}")
         print(f"  在浏览器中打开查看: file://{output_path.absolute()}")
@@ -582,132 +864,21 @@ class KnowledgeGraphBuilder:
         print(f"  • 点击节点高亮相关连接")
         return str(output_path)
 
-    def _enhance_html(self, html_path: Path, display_count: int, total_count: int):
+    @staticmethod
+    def _write_gzip(html_path: Path, html: bytes) -> Path:
         """
-        增强HTML文件，添加自定义样式和说明
+        预先生成gzip压缩版本，供Web服务直接以 Content-Encoding: gzip 返回
 
         参数:
             html_path: HTML文件路径
-            display_count: 显示的实体数量
-            total_count: 总实体数量
-        """
-        with open(html_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-
-        enhanced_html = html_content.replace(
-            '<body>',
-            f'''<body>
-            <style>
-                body {{
-                    margin: 0;
-                    padding: 0;
-                    font-family: 'Microsoft YaHei', 'SimHei', Arial, sans-serif;
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                }}
-                #header {{
-                    background: rgba(255, 255, 255, 0.95);
-                    padding: 20px;
-                    box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-                    text-align: center;
-                }}
-                #header h1 {{
-                    margin: 0;
-                    color: #2c3e50;
-                    font-size: 28px;
-                    font-weight: bold;
-                }}
-                #header p {{
-                    margin: 10px 0 0 0;
-                    color: #7f8c8d;
-                    font-size: 14px;
-                }}
-                #stats {{
-                    display: inline-block;
-                    margin-top: 10px;
-                    padding: 8px 16px;
-                    background: #ecf0f1;
-                    border-radius: 20px;
-                    font-size: 13px;
-                    color: #34495e;
-                }}
-                #legend {{
-                    position: absolute;
-                    top: 140px;
-                    right: 20px;
-                    background: rgba(255, 255, 255, 0.95);
-                    padding: 15px;
-                    border-radius: 8px;
-                    box-shadow: 0 2px 10px rgba(0,0,0,0.15);
-                    z-index: 1000;
-                    max-width: 240px;
-                }}
-                #legend h3 {{
-                    margin: 0 0 10px 0;
-                    color: #2c3e50;
-                    font-size: 16px;
-                }}
-                .legend-item {{
-                    display: flex;
-                    align-items: center;
-                    margin: 8px 0;
-                    font-size: 13px;
-                }}
-                .legend-color {{
-                    width: 20px;
-                    height: 20px;
-                    border-radius: 50%;
-                    margin-right: 10px;
-                    border: 2px solid #2c3e50;
-                }}
-                #mynetwork {{
-                    border-radius: 8px;
-                    margin: 20px;
-                    box-shadow: 0 4px 20px rgba(0,0,0,0.2);
-                }}
-            </style>
-            <div id="header">
-                <h1>🔍 知识图谱可视化</h1>
-                <p>展示文档中的实体关系网络 | 鼠标滚轮缩放 | 拖拽节点调整位置 | 悬停查看详细关系</p>
-                <div id="stats">
-                    📊 显示 <strong>{display_count}</strong> / {total_count} 个高频实体
-                </div>
-            </div>
-            <div id="legend">
-                <h3>📊 图例说明</h3>
-                <div class="legend-item">
-                    <div class="legend-color" style="background: #8e44ad;"></div>
-                    <span>自定义实体（高频）</span>
-                </div>
-                <div class="legend-item">
-                    <div class="legend-color" style="background: #9b59b6;"></div>
-                    <span>自定义实体（低频）</span>
-                </div>
-                <div class="legend-item">
-                    <div class="legend-color" style="background: #3498db;"></div>
-                    <span>普通实体（低频）</span>
-                </div>
-                <div class="legend-item">
-                    <div class="legend-color" style="background: #f39c12;"></div>
-                    <span>普通实体（中频）</span>
-                </div>
-                <div class="legend-item">
-                    <div class="legend-color" style="background: #e74c3c;"></div>
-                    <span>普通实体（高频）</span>
-                </div>
-                <div style="margin-top: 15px; padding-top: 15px; border-top: 1px solid #ecf0f1; font-size: 12px; color: #7f8c8d;">
-                    <strong>提示：</strong><br>
-                    • 节点大小 = 出现频率<br>
-                    • 边的粗细 = 关系强度<br>
-                    • 边标签 = 关系类型<br>
-                    • 悬停边查看上下文<br>
-                    • 支持多选和搜索
-                </div>
-            </div>
-            '''
-        )
+            html: HTML文件内容
 
-        with open(html_path, 'w', encoding='utf-8') as f:
-            f.write(enhanced_html)
+        返回:
+            压缩文件路径（原文件名追加.gz）
+        """
+        gz_path = html_path.with_name(html_path.name + ".gz")
+        gz_path.write_bytes(gzip.compress(html, compresslevel=9))
+        return gz_path
 
     def get_statistics(self) -> Dict:
         """
@@ -716,15 +887,39 @@ class KnowledgeGraphBuilder:
         返回:
             统计信息字典
         """
-        custom_entities_count = len([e for e in self.entities if e in self.custom_words])
+        custom_entities_count = len(self.entities & self.custom_words)
+        num_nodes = self.graph.number_of_nodes()
+        num_edges = self.graph.number_of_edges()
         
         return {
             "total_entities": len(self.entities),
             "custom_entities": custom_entities_count,
             "total_relations": len(self.relations),
-            "graph_nodes": self.graph.number_of_nodes(),
-            "graph_edges": self.graph.number_of_edges(),
+            "graph_nodes": num_nodes,
+            "graph_edges": num_edges,
             "top_entities": self.get_top_entities(10),
-            "relation_types": len(set([r[1] for r in self.relations])),
-            "avg_degree": sum(dict(self.graph.degree()).values()) / max(self.graph.number_of_nodes(), 1)
+            "relation_types": len(self.relation_type_counts),
+            # 有向图中每条边为两端各贡献1度（出度+入度），度数总和恒为边数的2倍
+            "avg_degree": 2 * num_edges / max(num_nodes, 1)
         }
+
+
+# ==================== 多进程工作函数 ====================
+
+_worker_builder: Optional[KnowledgeGraphBuilder] = None
+
+
+def _init_worker(custom_words: List[str]):
+    """工作进程初始化：创建进程内的构建器（编译正则和自动机）"""
+    global _worker_builder
+    _worker_builder = KnowledgeGraphBuilder(custom_words=custom_words, max_workers=1)
+
+
+def _count_entities_job(content: str) -> Tuple[List[str], Counter]:
+    """工作进程：提取单个文档的实体及频率"""
+    return _worker_builder._count_entities(content)
+
+
+def _extract_relations_job(content: str, entities: FrozenSet[str]) -> List[Tuple[str, str, str, str]]:
+    """工作进程：提取单个文档的关系"""
+    return _worker_builder.extract_relations(content, entities)
@@ -3,9 +3,18 @@
 用于调用云武AI的大语言模型API
 """
 
+import asyncio
+import weakref
+import importlib.util
 import requests
-import json
-from typing import Optional, Dict, Any
+import httpx
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Optional, Dict, Any, List, Iterator
+
+# 安装了h2时异步客户端启用HTTP/2（同一连接上多路复用并发请求）
+_HTTP2 = importlib.util.find_spec("h2") is not None
 
 
 class YunWuAIClient:
@@ -26,6 +35,25 @@ class YunWuAIClient:
         self.api_key = api_key
         self.api_url = api_url
         
+        # 复用会话：保持长连接并使用连接池，避免每次请求重新建立TCP/TLS连接
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        })
+        # 仅对建立连接失败等情况重试，已发出的POST请求不会重复发送
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=100,
+            max_retries=Retry(total=3, backoff_factor=0.3)
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
+        # 异步客户端在首次使用时按事件循环创建（连接池与事件循环绑定）
+        # 每个事件循环各自持有一个异步客户端，循环被回收时自动移除
+        self._aclients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        
     def generate(
         self, 
         prompt: str, 
@@ -57,13 +85,9 @@ class YunWuAIClient:
             }
             
             # 发送POST请求到API
-            response = requests.post(
+            response = self.session.post(
                 self.api_url,
-                json=payload,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {self.api_key}"
-                },
+                data=orjson.dumps(payload),
                 timeout=60  # 60秒超时
             )
             
@@ -71,7 +95,7 @@ class YunWuAIClient:
             response.raise_for_status()
             
             # 解析响应
-            result = response.json()
+            result = orjson.loads(response.content)
             
             # 提取生成的文本
             if isinstance(result, dict) and "choices" in result:
@@ -92,6 +116,154 @@ class YunWuAIClient:
         except Exception as e:
             return f"错误：生成回答时出现异常 - {str(e)}"
     
+    def generate_stream(
+        self, 
+        prompt: str, 
+        max_tokens: int = 500,
+        temperature: float = 0.7,
+        model: str = "deepseek-v3.2-exp",
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        流式调用云武AI，按服务端推送（SSE）逐段返回生成的文本
+        
+        参数:
+            prompt: 输入提示词
+            max_tokens: 最大生成token数
+            temperature: 温度参数，控制随机性
+            model: 模型名称
+            **kwargs: 其他可选参数
+            
+        返回:
+            文本片段迭代器（出错时返回一条错误信息）
+        """
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            **kwargs,
+            "stream": True
+        }
+        
+        try:
+            with self.session.post(self.api_url, data=orjson.dumps(payload), stream=True, timeout=60) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    # SSE数据行格式为 "data: {...}"，以 "data: [DONE]" 结束
+                    if not line.startswith(b"data: "):
+                        continue
+                    data = line[6:].strip()
+                    if data == b"[DONE]":
+                        break
+                    choices = orjson.loads(data).get("choices") or [{}]
+                    content = choices[0].get("delta", {}).get("content")
+                    if content:
+                        yield content
+                        
+        except requests.exceptions.Timeout:
+            yield "错误：请求超时，API响应时间过长"
+        except requests.exceptions.ConnectionError:
+            yield f"错误：无法连接到云武AI API ({self.api_url})，请检查网络连接"
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 401:
+                yield "错误：API密钥无效或未授权"
+            else:
+                yield f"错误：HTTP请求失败 - {str(e)}"
+        except requests.exceptions.RequestException as e:
+            yield f"错误：API请求失败 - {str(e)}"
+        except Exception as e:
+            yield f"错误：生成回答时出现异常 - {str(e)}"
+    
+    def _get_aclient(self) -> httpx.AsyncClient:
+        """获取当前事件循环对应的异步客户端，不存在时创建"""
+        loop = asyncio.get_running_loop()
+        client = self._aclients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                http2=_HTTP2,
+                timeout=60,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+                headers={
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {self.api_key}"
+                }
+            )
+            self._aclients[loop] = client
+        return client
+    
+    async def agenerate(
+        self, 
+        prompt: str, 
+        max_tokens: int = 500,
+        temperature: float = 0.7,
+        model: str = "deepseek-v3.2-exp",
+        **kwargs
+    ) -> str:
+        """
+        异步调用云武AI生成回答（参数与返回值同generate），可在事件循环中并发执行
+        """
+        try:
+            payload = {
+                "model": model,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                **kwargs
+            }
+            
+            response = await self._get_aclient().post(self.api_url, content=orjson.dumps(payload))
+            response.raise_for_status()
+            result = orjson.loads(response.content)
+            
+            if isinstance(result, dict) and "choices" in result:
+                return result["choices"][0]["message"]["content"]
+            else:
+                return str(result)
+                
+        except httpx.TimeoutException:
+            return "错误：请求超时，API响应时间过长"
+        except httpx.ConnectError:
+            return f"错误：无法连接到云武AI API ({self.api_url})，请检查网络连接"
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 401:
+                return "错误：API密钥无效或未授权"
+            return f"错误：HTTP请求失败 ({e.response.status_code}) - {str(e)}"
+        except httpx.HTTPError as e:
+            return f"错误：API请求失败 - {str(e)}"
+        except Exception as e:
+            return f"错误：生成回答时出现异常 - {str(e)}"
+    
+    async def _gather(self, prompts: List[str], **kwargs) -> List[str]:
+        """并发执行多个生成请求，完成后关闭本事件循环的异步客户端"""
+        try:
+            return await asyncio.gather(*[self.agenerate(p, **kwargs) for p in prompts])
+        finally:
+            await self.aclose()
+    
+    def generate_batch(self, prompts: List[str], **kwargs) -> List[str]:
+        """
+        并发生成多个回答（同步接口，不能在已运行的事件循环中调用，此时请直接使用agenerate）
+        
+        参数:
+            prompts: 提示词列表
+            **kwargs: 传给agenerate的参数
+            
+        返回:
+            与prompts顺序一致的回答列表
+        """
+        return asyncio.run(self._gather(prompts, **kwargs))
+    
+    async def aclose(self):
+        """关闭当前事件循环的异步客户端（客户端只能在创建它的循环上关闭）"""
+        client = self._aclients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+    
+    def close(self):
+        """关闭会话，释放连接池中的连接"""
+        self.session.close()
+    
     def test_connection(self) -> bool:
         """
         测试与云武AI API的连接
@@ -3,9 +3,14 @@
 用于调用本地部署的大语言模型
 """
 
+import asyncio
+import weakref
 import requests
-import json
-from typing import Optional, Dict, Any
+import httpx
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Optional, Dict, Any, List, Iterator
 
 
 class LocalLLMClient:
@@ -20,6 +25,22 @@ class LocalLLMClient:
         """
         self.api_url = api_url
         
+        # 复用会话：保持长连接并使用连接池，避免每次请求重新建立TCP连接
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        # 仅对建立连接失败等情况重试，已发出的POST请求不会重复发送
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=100,
+            max_retries=Retry(total=3, backoff_factor=0.3)
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
+        # 异步客户端在首次使用时按事件循环创建（连接池与事件循环绑定）
+        # 每个事件循环各自持有一个异步客户端，循环被回收时自动移除
+        self._aclients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        
     def generate(
         self, 
         prompt: str, 
@@ -49,10 +70,9 @@ class LocalLLMClient:
             }
             
             # 发送POST请求到本地API
-            response = requests.post(
+            response = self.session.post(
                 self.api_url,
-                json=payload,
-                headers={"Content-Type": "application/json"},
+                data=orjson.dumps(payload),
                 timeout=6000  # 60秒超时
             )
             
@@ -60,7 +80,7 @@ class LocalLLMClient:
             response.raise_for_status()
             
             # 解析响应
-            result = response.json()
+            result = orjson.loads(response.content)
             
             # 根据API返回格式提取文本
             # 这里假设返回格式为 {"response": "生成的文本"}
@@ -79,6 +99,145 @@ class LocalLLMClient:
         except Exception as e:
             return f"错误：生成回答时出现异常 - {str(e)}"
     
+    def generate_stream(
+        self, 
+        prompt: str, 
+        max_tokens: int = 500,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        流式调用本地大模型，逐段返回生成的文本
+        
+        支持逐行JSON（如 {"response": "..."}）和SSE（"data: {...}"）两种流式格式
+        
+        参数:
+            prompt: 输入提示词
+            max_tokens: 最大生成token数
+            temperature: 温度参数，控制随机性
+            **kwargs: 其他可选参数
+            
+        返回:
+            文本片段迭代器（出错时返回一条错误信息）
+        """
+        payload = {
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            **kwargs,
+            "stream": True
+        }
+        
+        try:
+            with self.session.post(self.api_url, data=orjson.dumps(payload), stream=True, timeout=6000) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if line.startswith(b"data: "):
+                        line = line[6:]
+                    line = line.strip()
+                    if not line:
+                        continue
+                    if line == b"[DONE]":
+                        break
+                    result = orjson.loads(line)
+                    if not isinstance(result, dict):
+                        continue
+                    if "choices" in result:
+                        choice = (result["choices"] or [{}])[0]
+                        content = choice.get("delta", {}).get("content") or choice.get("text")
+                    else:
+                        content = result.get("response", result.get("text"))
+                    if content:
+                        yield content
+                        
+        except requests.exceptions.Timeout:
+            yield "错误：请求超时，本地模型响应时间过长"
+        except requests.exceptions.ConnectionError:
+            yield f"错误：无法连接到本地模型API ({self.api_url})，请检查服务是否运行"
+        except requests.exceptions.RequestException as e:
+            yield f"错误：API请求失败 - {str(e)}"
+        except Exception as e:
+            yield f"错误：生成回答时出现异常 - {str(e)}"
+    
+    def _get_aclient(self) -> httpx.AsyncClient:
+        """获取当前事件循环对应的异步客户端，不存在时创建"""
+        loop = asyncio.get_running_loop()
+        client = self._aclients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=6000,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+                headers={"Content-Type": "application/json"}
+            )
+            self._aclients[loop] = client
+        return client
+    
+    async def agenerate(
+        self, 
+        prompt: str, 
+        max_tokens: int = 500,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> str:
+        """
+        异步调用本地大模型生成回答（参数与返回值同generate），可在事件循环中并发执行
+        """
+        try:
+            payload = {
+                "prompt": prompt,
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                **kwargs
+            }
+            
+            response = await self._get_aclient().post(self.api_url, content=orjson.dumps(payload))
+            response.raise_for_status()
+            result = orjson.loads(response.content)
+            
+            if isinstance(result, dict):
+                return result.get("response", result.get("text", str(result)))
+            else:
+                return str(result)
+                
+        except httpx.TimeoutException:
+            return "错误：请求超时，本地模型响应时间过长"
+        except httpx.ConnectError:
+            return f"错误：无法连接到本地模型API ({self.api_url})，请检查服务是否运行"
+        except httpx.HTTPError as e:
+            return f"错误：API请求失败 - {str(e)}"
+        except Exception as e:
+            return f"错误：生成回答时出现异常 - {str(e)}"
+    
+    async def _gather(self, prompts: List[str], **kwargs) -> List[str]:
+        """并发执行多个生成请求，完成后关闭本事件循环的异步客户端"""
+        try:
+            return await asyncio.gather(*[self.agenerate(p, **kwargs) for p in prompts])
+        finally:
+            await self.aclose()
+    
+    def generate_batch(self, prompts: List[str], **kwargs) -> List[str]:
+        """
+        并发生成多个回答（同步接口，不能在已运行的事件循环中调用，此时请直接使用agenerate）
+        
+        参数:
+            prompts: 提示词列表
+            **kwargs: 传给agenerate的参数
+            
+        返回:
+            与prompts顺序一致的回答列表
+        """
+        return asyncio.run(self._gather(prompts, **kwargs))
+    
+    async def aclose(self):
+        """关闭当前事件循环的异步客户端（客户端只能在创建它的循环上关闭）"""
+        client = self._aclients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+    
+    def close(self):
+        """关闭会话，释放连接池中的连接"""
+        self.session.close()
+    
     def test_connection(self) -> bool:
         """
         测试与本地API的连接
@@ -87,7 +246,7 @@ class LocalLLMClient:
             连接是否成功
         """
         try:
-            response = requests.get(
+            response = self.session.get(
                 self.api_url.replace("/api/infer", "/health"),
                 timeout=5
             )
@@ -1,11 +1,20 @@
 """
 RAG系统主模块 - 整合所有组件
 """
+import asyncio
+import os
 import sys
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict, Optional
 from pathlib import Path
 from sentence_transformers import SentenceTransformer
+
+try:
+    import torch
+except ImportError:  # 仅使用ONNX/OpenVINO后端时可不安装torch
+    torch = None
 from tqdm import tqdm
 
 from config import RAGConfig
@@ -13,7 +22,7 @@ from text_processor import TextProcessor
 from retriever import Retriever
 from reranker import Reranker
 from generator import AnswerGenerator
-from cache_manager import CacheManager
+from cache_manager import CacheManager, EmbeddingCache
 
 # 导入外部依赖（假设这些模块已存在）
 from document_loader import DocumentLoader
@@ -54,6 +63,7 @@ class EnhancedRAGSystem:
         api_url = api_url or self.config.LLM_API_URL
         api_key = api_key or self.config.LLM_API_KEY
         embedding_model_name = embedding_model_name or self.config.EMBEDDING_MODEL_NAME
+        self.embedding_model_name = embedding_model_name
         chunk_size = chunk_size or self.config.CHUNK_SIZE
         chunk_overlap = chunk_overlap or self.config.CHUNK_OVERLAP
         
@@ -74,7 +84,7 @@ class EnhancedRAGSystem:
             
             pbar.set_description("加载嵌入模型")
             try:
-                self.embedding_model = SentenceTransformer(embedding_model_name)
+                self.embedding_model = self._load_embedding_model(embedding_model_name)
                 embedding_dim = self.embedding_model.get_sentence_embedding_dimension()
                 pbar.update(1)
             except Exception as e:
@@ -84,8 +94,22 @@ class EnhancedRAGSystem:
                 sys.exit(1)
             
             pbar.set_description("初始化缓存管理器")
-            cache_path = Path(cache_dir or self.config.CACHE_DIR) / self.config.CACHE_FILE
-            self.cache_manager = CacheManager(cache_path)
+            self.cache_root = Path(cache_dir or self.config.CACHE_DIR)
+            cache_path = self.cache_root / self.config.CACHE_FILE
+            self.cache_manager = CacheManager(
+                cache_path,
+                max_size=self.config.CACHE_MEMORY_SIZE,
+                embedding_fn=self._embed_for_cache if self.config.ENABLE_SEMANTIC_CACHE else None,
+                embedding_dim=embedding_dim,
+                semantic_threshold=self.config.SEMANTIC_CACHE_THRESHOLD,
+                semantic_max_elements=self.config.SEMANTIC_CACHE_MAX_ELEMENTS,
+                flush_interval=self.config.CACHE_FLUSH_INTERVAL,
+                flush_batch=self.config.CACHE_FLUSH_BATCH
+            )
+            self.embedding_cache = EmbeddingCache(
+                self.cache_root / self.config.EMBEDDING_CACHE_DIR,
+                model_name=embedding_model_name
+            )
             pbar.update(1)
             
             pbar.set_description("初始化完成")
@@ -102,9 +126,74 @@ class EnhancedRAGSystem:
         self.reranker = None
         self.generator = None
         
+        # 同步ask复用同一个事件循环，使异步LLM客户端的连接池跨请求保持
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        
+        # 增量添加/删除文档可能在不同线程中同时进行（上传后台重建、删除接口），互斥执行
+        # 可重入：add_documents会对同名旧文档调用remove_document
+        self._update_lock = threading.RLock()
+        
+        # 是否处于交互式问答模式（决定ask默认是否显示进度条）
+        self._interactive = False
+        
         # 加载并处理文档
         self._load_and_process_documents()
     
+    def _load_embedding_model(self, model_name: str) -> SentenceTransformer:
+        """
+        加载嵌入模型并按运行环境设置推理方式
+        
+        - CPU：推理线程数设为全部CPU核数
+        - GPU：EMBEDDING_FP16开启时转为半精度
+        - EMBEDDING_BACKEND为onnx/openvino时使用对应的推理后端
+        - 查询指令前缀注册为"query"提示词（sentence-transformers>=2.4）
+        
+        参数:
+            model_name: 模型名称或本地路径
+            
+        返回:
+            SentenceTransformer模型
+        """
+        backend = self.config.EMBEDDING_BACKEND
+        use_cuda = torch is not None and torch.cuda.is_available()
+        
+        # 线程数需在模型创建前设置
+        if torch is not None and not use_cuda:
+            torch.set_num_threads(os.cpu_count() or 1)
+        
+        kwargs = {}
+        if backend != "torch":
+            kwargs["backend"] = backend
+            if self.config.EMBEDDING_ONNX_FILE:
+                kwargs["model_kwargs"] = {"file_name": self.config.EMBEDDING_ONNX_FILE}
+        
+        model = SentenceTransformer(model_name, **kwargs)
+        
+        # 查询编码时以prompt_name="query"引用，文档块编码不受影响（不设置default_prompt_name）
+        if isinstance(getattr(model, "prompts", None), dict):
+            model.prompts["query"] = self.config.EMBEDDING_QUERY_PROMPT
+        
+        if backend == "torch" and use_cuda and self.config.EMBEDDING_FP16:
+            model.half()
+            print("✓ 嵌入模型以FP16在GPU上推理")
+        elif backend != "torch":
+            print(f"✓ 嵌入模型使用 {backend} 推理后端")
+        return model
+    
+    def _embed_for_cache(self, query: str):
+        """
+        为语义缓存生成查询嵌入（归一化向量）
+        复用检索器的查询编码（同一指令与LRU缓存），缓存未命中时检索不再重复前向计算
+        """
+        if self.retriever is not None:
+            return self.retriever.embed_query(query)[0]
+        if 'query' in (getattr(self.embedding_model, 'prompts', None) or {}):
+            return self.embedding_model.encode(query, prompt_name='query', normalize_embeddings=True)
+        return self.embedding_model.encode(
+            self.config.EMBEDDING_QUERY_PROMPT + query, normalize_embeddings=True
+        )
+    
     def _load_and_process_documents(self):
         """加载并处理文档"""
         print("\n" + "=" * 60)
@@ -124,40 +213,209 @@ class EnhancedRAGSystem:
             return
         
         print("\n正在分块处理文档...")
-        for doc in tqdm(self.documents, desc="文档分块", ncols=80):
-            chunks = self.text_processor.split_into_chunks(doc["content"])
-            
-            for chunk_idx, chunk_content in enumerate(chunks):
-                self.document_chunks.append({
-                    "title": doc["title"],
-                    "chunk_id": f"{doc['title']}_chunk_{chunk_idx + 1}",
-                    "content": chunk_content,
-                    "original_doc": doc,
-                    "chunk_index": chunk_idx,
-                    "total_chunks": len(chunks)
-                })
+        contents = [doc["content"] for doc in self.documents]
+        
+        # 分块是纯CPU计算且各文档相互独立，文档较多时用多进程并行切分
+        workers = max(1, min(self.config.CHUNK_WORKERS or os.cpu_count() or 1, len(contents)))
+        executor = None
+        if workers > 1 and len(contents) >= self.config.CHUNK_PARALLEL_MIN_DOCUMENTS:
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_chunk_worker,
+                initargs=(self.text_processor.chunk_size, self.text_processor.chunk_overlap)
+            )
+            print(f"使用 {workers} 个进程并行分块")
+        chunksize = max(1, min(16, len(contents) // (workers * 4)))
+        
+        try:
+            # 工作进程只返回分块文本，文档块字典在主进程构建，使original_doc引用同一文档对象
+            if executor:
+                split_results = executor.map(_split_job, contents, chunksize=chunksize)
+            else:
+                split_results = map(self.text_processor.split_into_chunks, contents)
+            for doc, chunks in tqdm(zip(self.documents, split_results), total=len(contents), desc="文档分块", ncols=80):
+                self.document_chunks.extend(self._build_chunks(doc, chunks))
+        finally:
+            if executor:
+                executor.shutdown()
         
         print(f"✓ 完成分块: {len(self.documents)} 个文档 → {len(self.document_chunks)} 个文档块")
         
         print("\n正在初始化语义检索器...")
-        self.retriever = Retriever(
-            embedding_model=self.embedding_model,
-            document_chunks=self.document_chunks
-        )
+        self.retriever = self._create_retriever(self.document_chunks)
         
         stats = self.retriever.get_statistics()
         print(f"✓ 检索器就绪: {stats['model_name']} | 维度: {stats['embedding_dimension']} | 方法: 语义检索")
         
-        # 初始化重排序器和生成器
-        self.reranker = Reranker(self.llm_client)
+        self._init_components()
+        
+        print(f"\n已加载文档: {', '.join([doc['title'] for doc in self.documents])}")
+    
+    def _create_retriever(self, document_chunks: List[Dict]) -> Retriever:
+        """基于文档块创建语义检索器"""
+        return Retriever(
+            embedding_model=self.embedding_model,
+            document_chunks=document_chunks,
+            batch_size=self.config.EMBEDDING_BATCH_SIZE,
+            embedding_cache=self.embedding_cache,
+            index_type=self.config.RETRIEVAL_INDEX,
+            hnsw_m=self.config.HNSW_M,
+            ef_construction=self.config.HNSW_EF_CONSTRUCTION,
+            ef_search=self.config.HNSW_EF_SEARCH,
+            index_path=self.cache_root / self.config.INDEX_FILE,
+            quantization=self.config.EMBEDDING_QUANT,
+            rescore_factor=self.config.QUANT_RESCORE_FACTOR,
+            query_cache_size=self.config.QUERY_EMBEDDING_CACHE_SIZE,
+            model_name=self.embedding_model_name,
+            hnsw_min_chunks=self.config.HNSW_MIN_CHUNKS,
+            query_prompt=self.config.EMBEDDING_QUERY_PROMPT
+        )
+    
+    def _init_components(self):
+        """初始化重排序器和生成器"""
+        self.reranker = Reranker(
+            self.llm_client,
+            concurrency=self.config.RERANK_CONCURRENCY,
+            model_name=self.config.RERANK_MODEL_NAME,
+            batch_size=self.config.RERANK_BATCH_SIZE,
+            skip_margin=self.config.RERANK_SKIP_MARGIN
+        )
         self.generator = AnswerGenerator(
             llm_client=self.llm_client,
             max_tokens=self.config.MAX_TOKENS,
             temperature=self.config.TEMPERATURE,
             enable_citation=self.config.ENABLE_CITATION
         )
+    
+    def _chunk_document(self, doc: Dict) -> List[Dict]:
+        """
+        将单个文档切分为文档块
         
-        print(f"\n已加载文档: {', '.join([doc['title'] for doc in self.documents])}")
+        参数:
+            doc: 文档字典，包含标题和内容
+            
+        返回:
+            文档块列表
+        """
+        return self._build_chunks(doc, self.text_processor.split_into_chunks(doc["content"]))
+    
+    def _build_chunks(self, doc: Dict, chunks: List[str]) -> List[Dict]:
+        """
+        由文档的分块文本构建文档块字典
+        
+        参数:
+            doc: 文档字典，包含标题和内容
+            chunks: 文档切分后的文本列表
+            
+        返回:
+            文档块列表
+        """
+        return [
+            {
+                "title": doc["title"],
+                "chunk_id": f"{doc['title']}_chunk_{chunk_idx + 1}",
+                "content": chunk_content,
+                "original_doc": doc,
+                "chunk_index": chunk_idx,
+                "total_chunks": len(chunks)
+            }
+            for chunk_idx, chunk_content in enumerate(chunks)
+        ]
+    
+    def _document_title(self, file_path: str) -> str:
+        """根据文件路径计算文档标题（相对于文档文件夹的路径）"""
+        return os.path.relpath(file_path, self.doc_loader.documents_dir)
+    
+    def add_document(self, file_path: str) -> int:
+        """
+        增量添加单个文档：只为该文档的新块生成嵌入向量
+        同名文档已存在时先删除旧版本
+        
+        参数:
+            file_path: 文档文件路径
+            
+        返回:
+            新增的文档块数量
+        """
+        return self.add_documents([file_path]).get(file_path, 0)
+    
+    def add_documents(self, file_paths: List[str]) -> Dict[str, int]:
+        """
+        批量增量添加文档：所有新文档块一次性生成嵌入向量并加入索引
+        同名文档已存在时先删除旧版本
+        
+        参数:
+            file_paths: 文档文件路径列表
+            
+        返回:
+            {文件路径: 新增的文档块数量}
+        """
+        with self._update_lock:
+            added = {}
+            new_docs = []
+            new_chunks = []
+            
+            for file_path in file_paths:
+                added[file_path] = 0
+                title = self._document_title(file_path)
+                if any(doc["title"] == title for doc in self.documents):
+                    self.remove_document(file_path)
+            
+                if Path(file_path).suffix.lower() not in self.doc_loader.supported_extensions:
+                    print(f"跳过不支持的文件类型: {title}")
+                    continue
+            
+                content = self.doc_loader.load_text_file(file_path)
+                if not content.strip():
+                    continue
+            
+                doc = {"title": title, "content": content}
+                chunks = self._chunk_document(doc)
+                new_docs.append(doc)
+                new_chunks.extend(chunks)
+                added[file_path] = len(chunks)
+            
+            if not new_chunks:
+                return added
+            
+            if self.retriever is None:
+                self.retriever = self._create_retriever(new_chunks)
+                self._init_components()
+            else:
+                self.retriever.add_chunks(new_chunks)
+            
+            self.documents.extend(new_docs)
+            self.document_chunks.extend(new_chunks)
+            for doc in new_docs:
+                print(f"✓ 已添加文档: {doc['title']}")
+            print(f"✓ 共添加 {len(new_docs)} 个文档 ({len(new_chunks)} 个文档块)")
+            return added
+    
+    def remove_document(self, file_path: str) -> int:
+        """
+        增量删除单个文档：检索器中对应的块标记为已删除
+        
+        参数:
+            file_path: 文档文件路径
+            
+        返回:
+            删除的文档块数量
+        """
+        title = self._document_title(file_path)
+        with self._update_lock:
+            self.documents = [doc for doc in self.documents if doc["title"] != title]
+            self.document_chunks = [chunk for chunk in self.document_chunks if chunk["title"] != title]
+            
+            removed = self.retriever.remove_chunks(title) if self.retriever else 0
+        if removed:
+            print(f"✓ 已删除文档: {title} ({removed} 个文档块)")
+        return removed
+    
+    def clear_cache(self):
+        """清除问答缓存和查询向量缓存"""
+        self.cache_manager.clear()
+        if self.retriever:
+            self.retriever.clear_query_cache()
     
     def ask(
         self, 
@@ -166,10 +424,11 @@ class EnhancedRAGSystem:
         top_k: int = None,
         custom_instruction: Optional[str] = None,
         enable_followup: bool = None,
-        show_score_details: bool = None
+        show_score_details: bool = None,
+        show_progress: bool = None
     ) -> Dict:
         """
-        完整的RAG流程：语义检索 + 重排序 + 生成
+        完整的RAG流程：语义检索 + 重排序 + 生成（同步接口，内部执行aask）
         
         参数:
             query: 用户查询
@@ -178,6 +437,45 @@ class EnhancedRAGSystem:
             custom_instruction: 自定义生成指令
             enable_followup: 是否生成后续问题建议
             show_score_details: 是否显示详细评分信息
+            show_progress: 是否显示进度条，默认仅在交互模式下显示
+            
+        返回:
+            包含检索结果和生成回答的字典
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+            return self._loop.run_until_complete(self.aask(
+                query,
+                use_cache=use_cache,
+                top_k=top_k,
+                custom_instruction=custom_instruction,
+                enable_followup=enable_followup,
+                show_score_details=show_score_details,
+                show_progress=show_progress
+            ))
+    
+    async def aask(
+        self, 
+        query: str, 
+        use_cache: bool = True, 
+        top_k: int = None,
+        custom_instruction: Optional[str] = None,
+        enable_followup: bool = None,
+        show_score_details: bool = None,
+        show_progress: bool = None
+    ) -> Dict:
+        """
+        异步RAG流程：检索在线程池中执行，重排序的打分请求并发发出，生成时不阻塞事件循环
+        
+        参数:
+            query: 用户查询
+            use_cache: 是否使用缓存
+            top_k: 检索的文档块数量
+            custom_instruction: 自定义生成指令
+            enable_followup: 是否生成后续问题建议
+            show_score_details: 是否显示详细评分信息
+            show_progress: 是否显示进度条，默认仅在交互模式下显示
             
         返回:
             包含检索结果和生成回答的字典
@@ -189,65 +487,100 @@ class EnhancedRAGSystem:
         top_k = top_k or self.config.DEFAULT_TOP_K
         enable_followup = enable_followup if enable_followup is not None else self.config.ENABLE_FOLLOWUP
         show_score_details = show_score_details if show_score_details is not None else self.config.ENABLE_SCORE_DETAILS
+        show_progress = show_progress if show_progress is not None else self._interactive
         
         # 检查缓存
         if use_cache:
-            cached_result = self.cache_manager.get(query)
+            cached_result = await asyncio.to_thread(self.cache_manager.get, query)
             if cached_result:
                 print("✓ 使用缓存结果")
                 return cached_result
         
         start_time = time.time()
         
-        with tqdm(total=3, desc="RAG处理流程", ncols=80, bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt}') as pbar:
+        # 程序化调用时禁用进度条（disable后tqdm不创建输出，set_description/update均为空操作）
+        with tqdm(total=3, desc="RAG处理流程", ncols=80, bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt}', disable=not show_progress) as pbar:
             pbar.set_description("检索相关文档")
-            retrieved_chunks = self.retriever.retrieve(
+            retrieved_chunks = await asyncio.to_thread(
+                self.retriever.retrieve,
                 query=query,
                 top_k=top_k,
                 return_score_details=show_score_details
             )
             pbar.update(1)
             
-            if not retrieved_chunks:
-                print("\n✗ 未找到相关文档")
-                result = {
-                    "query": query,
-                    "retrieved_chunks": [],
-                    "answer": self.generator._generate_no_context_response(query),
-                    "processing_time": time.time() - start_time
-                }
-                self.cache_manager.set(query, result)
-                return result
-            
-            #print(f"\n✓ 找到 {len(retrieved_chunks)} 个相关文档块")
-            #if show_score_details:
-                #for i, chunk in enumerate(retrieved_chunks, 1):
-                   # print(f"  [{i}] {chunk['title']} (chunk {chunk['chunk_index'] + 1}) - 相关度: {chunk['score']:.4f}")
-            
-            pbar.set_description("重排序优化")
-            reranked_chunks = self.reranker.rerank(
+            return await self._aanswer(
                 query,
                 retrieved_chunks,
-                top_k=self.config.RERANK_TOP_K
+                start_time,
+                custom_instruction=custom_instruction,
+                enable_followup=enable_followup,
+                pbar=pbar
             )
-            pbar.update(1)
+    
+    async def _aanswer(
+        self,
+        query: str,
+        retrieved_chunks: List[Dict],
+        start_time: float,
+        custom_instruction: Optional[str],
+        enable_followup: bool,
+        pbar: tqdm
+    ) -> Dict:
+        """
+        对检索结果执行重排序和生成，构建结果并存入缓存
+        
+        参数:
+            query: 用户查询
+            retrieved_chunks: 检索到的文档块
+            start_time: 开始处理的时间戳（用于计算耗时）
+            custom_instruction: 自定义生成指令
+            enable_followup: 是否生成后续问题建议
+            pbar: 进度条（重排序、生成各前进一步）
             
-            pbar.set_description("生成回答")
-            if enable_followup:
-                generation_result = self.generator.generate_with_followup(
-                    query=query,
-                    context_chunks=reranked_chunks
-                )
-                answer = generation_result["answer"]
-                followup_questions = generation_result.get("followup_questions", [])
-            else:
-                answer = self.generator.generate(
-                    query=query,
-                    context_chunks=reranked_chunks,
-                    custom_instruction=custom_instruction
-                )
-                followup_questions = []
-            pbar.update(1)
+        返回:
+            包含检索结果和生成回答的字典
+        """
+        if not retrieved_chunks:
+            print("\n✗ 未找到相关文档")
+            result = {
+                "query": query,
+                "retrieved_chunks": [],
+                "answer": self.generator._generate_no_context_response(query),
+                "processing_time": time.time() - start_time
+            }
+            await asyncio.to_thread(self.cache_manager.set, query, result)
+            return result
+        
+        #print(f"\n✓ 找到 {len(retrieved_chunks)} 个相关文档块")
+        #if show_score_details:
+            #for i, chunk in enumerate(retrieved_chunks, 1):
+               # print(f"  [{i}] {chunk['title']} (chunk {chunk['chunk_index'] + 1}) - 相关度: {chunk['score']:.4f}")
+        
+        pbar.set_description("重排序优化")
+        reranked_chunks = await self.reranker.arerank(
+            query,
+            retrieved_chunks,
+            top_k=self.config.RERANK_TOP_K
+        )
+        pbar.update(1)
+        
+        pbar.set_description("生成回答")
+        if enable_followup:
+            generation_result = await self.generator.agenerate_with_followup(
+                query=query,
+                context_chunks=reranked_chunks
+            )
+            answer = generation_result["answer"]
+            followup_questions = generation_result.get("followup_questions", [])
+        else:
+            answer = await self.generator.agenerate(
+                query=query,
+                context_chunks=reranked_chunks,
+                custom_instruction=custom_instruction
+            )
+            followup_questions = []
+        pbar.update(1)
         
         processing_time = time.time() - start_time
         print(f"✓ 处理完成 (耗时: {processing_time:.2f}秒)")
@@ -264,10 +597,118 @@ class EnhancedRAGSystem:
             result["followup_questions"] = followup_questions
         
         # 存入缓存
-        self.cache_manager.set(query, result)
+        await asyncio.to_thread(self.cache_manager.set, query, result)
         
         return result
     
+    def ask_batch(
+        self,
+        queries: List[str],
+        use_cache: bool = True,
+        top_k: int = None,
+        custom_instruction: Optional[str] = None,
+        enable_followup: bool = None,
+        show_score_details: bool = None,
+        show_progress: bool = None
+    ) -> List[Dict]:
+        """
+        批量问答（同步接口，内部执行aask_batch），适用于评测或批量处理问题
+        
+        参数:
+            queries: 用户查询列表
+            其余参数同ask
+            
+        返回:
+            与queries顺序一致的结果字典列表
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+            return self._loop.run_until_complete(self.aask_batch(
+                queries,
+                use_cache=use_cache,
+                top_k=top_k,
+                custom_instruction=custom_instruction,
+                enable_followup=enable_followup,
+                show_score_details=show_score_details,
+                show_progress=show_progress
+            ))
+    
+    async def aask_batch(
+        self,
+        queries: List[str],
+        use_cache: bool = True,
+        top_k: int = None,
+        custom_instruction: Optional[str] = None,
+        enable_followup: bool = None,
+        show_score_details: bool = None,
+        show_progress: bool = None
+    ) -> List[Dict]:
+        """
+        异步批量问答：未命中缓存的查询一次编码、一次矩阵乘法完成检索，
+        各查询的重排序和生成请求并发执行
+        
+        参数:
+            queries: 用户查询列表
+            其余参数同aask
+            
+        返回:
+            与queries顺序一致的结果字典列表
+        """
+        print(f"\n{'='*60}")
+        print(f"批量问答: {len(queries)} 个问题")
+        print('='*60)
+        
+        top_k = top_k or self.config.DEFAULT_TOP_K
+        enable_followup = enable_followup if enable_followup is not None else self.config.ENABLE_FOLLOWUP
+        show_score_details = show_score_details if show_score_details is not None else self.config.ENABLE_SCORE_DETAILS
+        show_progress = show_progress if show_progress is not None else self._interactive
+        
+        results: List[Optional[Dict]] = [None] * len(queries)
+        
+        if use_cache:
+            cached_results = await asyncio.gather(*[
+                asyncio.to_thread(self.cache_manager.get, query) for query in queries
+            ])
+            for i, cached_result in enumerate(cached_results):
+                if cached_result:
+                    results[i] = cached_result
+            if any(results):
+                print(f"✓ {sum(1 for result in results if result)} 个问题使用缓存结果")
+        
+        pending = [i for i, result in enumerate(results) if not result]
+        if not pending:
+            return results
+        
+        start_time = time.time()
+        batch_chunks = await asyncio.to_thread(
+            self.retriever.retrieve_batch,
+            [queries[i] for i in pending],
+            top_k=top_k,
+            return_score_details=show_score_details
+        )
+        
+        # 单个查询的内部步骤不显示进度，整体按完成的问题数显示
+        step_pbar = tqdm(disable=True)
+        with tqdm(total=len(pending), desc="批量问答", ncols=80, disable=not show_progress) as pbar:
+            async def answer(i: int, retrieved_chunks: List[Dict]) -> None:
+                results[i] = await self._aanswer(
+                    queries[i],
+                    retrieved_chunks,
+                    start_time,
+                    custom_instruction=custom_instruction,
+                    enable_followup=enable_followup,
+                    pbar=step_pbar
+                )
+                pbar.update(1)
+            
+            await asyncio.gather(*[
+                answer(i, retrieved_chunks) for i, retrieved_chunks in zip(pending, batch_chunks)
+            ])
+        
+        print(f"✓ 批量问答完成 (耗时: {time.time() - start_time:.2f}秒)")
+        return results
+    
     def interactive_mode(self):
         """交互式问答模式"""
         print("\n" + "=" * 60)
@@ -280,6 +721,7 @@ class EnhancedRAGSystem:
         print("  • 输入 'clear cache' 清除缓存")
         print("=" * 60)
         
+        self._interactive = True
         while True:
             try:
                 user_input = input("\n请输入问题: ").strip()
@@ -293,7 +735,7 @@ class EnhancedRAGSystem:
                     continue
                 
                 if user_input.lower() == 'clear cache':
-                    self.cache_manager.clear()
+                    self.clear_cache()
                     print("✓ 缓存已清除")
                     continue
                 
@@ -323,6 +765,8 @@ class EnhancedRAGSystem:
                 break
             except Exception as e:
                 print(f"\n✗ 错误: {str(e)}")
+        
+        self._interactive = False
     
     def _show_stats(self):
         """显示系统统计信息"""
@@ -351,3 +795,19 @@ class EnhancedRAGSystem:
         if doc_stats['file_types']:
             print(f"  • 文件类型: {', '.join([f'{ext}({count})' for ext, count in doc_stats['file_types'].items()])}")
         print("=" * 60)
+
+
+# ==================== 多进程工作函数 ====================
+
+_worker_text_processor: Optional[TextProcessor] = None
+
+
+def _init_chunk_worker(chunk_size: int, chunk_overlap: int):
+    """工作进程初始化：创建进程内的文本处理器（分块不依赖自定义词典）"""
+    global _worker_text_processor
+    _worker_text_processor = TextProcessor(chunk_size, chunk_overlap)
+
+
+def _split_job(content: str) -> List[str]:
+    """工作进程：切分单个文档"""
+    return _worker_text_processor.split_into_chunks(content)
@@ -1,25 +1,80 @@
 """
-重排序模块 - 使用LLM对检索结果进行重排序
+重排序模块 - 使用交叉编码器或LLM对检索结果进行重排序
 """
-from typing import List, Dict
+import asyncio
+import re
+from typing import List, Dict, Optional
+
+import numpy as np
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:  # 未安装时退回LLM打分重排序
+    CrossEncoder = None
+
+
+# 从LLM回答中提取相关度分数
+_SCORE_PATTERN = re.compile(r"\d+(?:\.\d+)?")
 
 
 class Reranker:
     """重排序器 - 使用LLM提升检索结果的相关性排序"""
     
-    def __init__(self, llm_client):
+    def __init__(
+        self, 
+        llm_client, 
+        concurrency: int = 8,
+        model_name: Optional[str] = None,
+        batch_size: int = 32,
+        skip_margin: Optional[float] = None
+    ):
         """
         初始化重排序器
         
         参数:
-            llm_client: LLM客户端，用于调用大语言模型
+            llm_client: LLM客户端，交叉编码器不可用时用于打分
+            concurrency: 同时进行的LLM打分请求数上限
+            model_name: 交叉编码器模型名称或路径（如 BAAI/bge-reranker-large），None则使用LLM打分
+            batch_size: 交叉编码器批量打分的批大小
+            skip_margin: LLM重排序的跳过阈值，第1名与第top_k名的检索分数差超过该值时直接采用检索排序，None表示总是重排序
         """
         self.llm_client = llm_client
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.skip_margin = skip_margin
+        
+        # 交叉编码器在本地一次前向计算所有(查询, 文档块)对的分数，省去远程LLM调用
+        self.cross_encoder = None
+        if model_name:
+            if CrossEncoder is None:
+                print("✗ 未安装sentence-transformers，使用LLM重排序")
+            else:
+                try:
+                    self.cross_encoder = CrossEncoder(model_name)
+                    print(f"✓ 成功加载重排序模型 {model_name}")
+                except Exception as e:
+                    print(f"✗ 重排序模型加载失败，使用LLM重排序: {e}")
     
     def rerank(self, query: str, search_results: List[Dict], top_k: int = 3) -> List[Dict]:
         """
-        使用LLM对检索结果进行重排序
-        通过让LLM判断文档与查询的相关性来优化排序
+        使用LLM对检索结果进行重排序（同步接口，不能在已运行的事件循环中调用，此时请直接使用arerank）
+        
+        参数:
+            query: 用户查询
+            search_results: 初始检索结果
+            top_k: 重排序后返回的数量
+            
+        返回:
+            重排序后的文档块列表
+        """
+        if self.cross_encoder is not None:
+            return self._cross_encoder_rerank(query, search_results, top_k)
+        return asyncio.run(self.arerank(query, search_results, top_k))
+    
+    async def arerank(self, query: str, search_results: List[Dict], top_k: int = 3) -> List[Dict]:
+        """
+        异步重排序：交叉编码器在线程池中打分；
+        使用LLM时每个文档块单独请求打分，各请求并发执行，按分数从高到低排序
         
         参数:
             query: 用户查询
@@ -33,81 +88,115 @@ class Reranker:
         if len(search_results) <= top_k:
             return search_results
         
-        # 构建重排序提示词
-        prompt = self._build_rerank_prompt(query, search_results)
+        if self.cross_encoder is not None:
+            return await asyncio.to_thread(self._cross_encoder_rerank, query, search_results, top_k)
+        
+        # 检索分数已明显拉开时LLM重排序难有收益，省去本次查询的全部打分请求
+        if self._well_separated(search_results, top_k):
+            return search_results[:top_k]
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def score(chunk: Dict) -> float:
+            async with semaphore:
+                response = await self._agenerate(
+                    prompt=self._build_score_prompt(query, chunk),
+                    max_tokens=10,
+                    temperature=0.0  # 使用确定性输出
+                )
+            return self._parse_score(response)
         
-        # 调用LLM进行重排序
         try:
-            rerank_response = self.llm_client.generate(
-                prompt=prompt,
-                max_tokens=100,
-                temperature=0.0  # 使用确定性输出
-            )
-            
-            # 解析LLM返回的排序索引
-            reranked_indices = self._parse_rerank_response(rerank_response, len(search_results))
-            
-            # 根据重排序结果返回文档块
-            return [search_results[i] for i in reranked_indices[:top_k]]
-            
+            scores = await asyncio.gather(*[score(chunk) for chunk in search_results])
         except Exception as e:
             print(f"重排序失败: {e}")
             # 失败时返回原始排序的前top_k结果
             return search_results[:top_k]
+        
+        # 稳定排序：分数相同（含无法解析的）的文档块保持原始顺序
+        order = sorted(range(len(search_results)), key=lambda i: -scores[i])
+        return [search_results[i] for i in order[:top_k]]
     
-    def _build_rerank_prompt(self, query: str, search_results: List[Dict]) -> str:
+    def _cross_encoder_rerank(self, query: str, search_results: List[Dict], top_k: int) -> List[Dict]:
         """
-        构建重排序提示词
+        使用交叉编码器批量计算相关度并排序
         
         参数:
             query: 用户查询
-            search_results: 检索结果
+            search_results: 初始检索结果
+            top_k: 重排序后返回的数量
             
         返回:
-            提示词字符串
+            重排序后的文档块列表
         """
-        # 构建文档块列表
-        document_list = "\n".join([
-            f"{i}. {chunk['content'][:200]}..."
-            for i, chunk in enumerate(search_results)
-        ])
+        if len(search_results) <= top_k:
+            return search_results
         
-        prompt = f"""请根据与以下查询的相关性，对提供的文档块进行排序。
-只返回排序后的索引（从0开始），用逗号分隔，不添加任何解释。
+        try:
+            scores = self.cross_encoder.predict(
+                [(query, chunk['content']) for chunk in search_results],
+                batch_size=self.batch_size,
+                show_progress_bar=False
+            )
+        except Exception as e:
+            print(f"重排序失败: {e}")
+            return search_results[:top_k]
+        
+        order = np.argsort(-np.asarray(scores), kind="stable")
+        return [search_results[i] for i in order[:top_k]]
+    
+    def _well_separated(self, search_results: List[Dict], top_k: int) -> bool:
+        """判断检索结果前top_k名的分数是否已足够拉开（第1名与第top_k名之差超过skip_margin）"""
+        if self.skip_margin is None or top_k <= 0:
+            return False
+        first = search_results[0].get('score')
+        last = search_results[top_k - 1].get('score')
+        if first is None or last is None:
+            return False
+        return first - last > self.skip_margin
+    
+    async def _agenerate(self, **kwargs) -> str:
+        """异步调用LLM；客户端不支持agenerate时在线程池中执行同步generate"""
+        agenerate = getattr(self.llm_client, "agenerate", None)
+        if agenerate is not None:
+            return await agenerate(**kwargs)
+        return await asyncio.to_thread(self.llm_client.generate, **kwargs)
+    
+    def _build_score_prompt(self, query: str, chunk: Dict) -> str:
+        """
+        构建单个文档块的相关度打分提示词
+        
+        参数:
+            query: 用户查询
+            chunk: 文档块
+            
+        返回:
+            提示词字符串
+        """
+        return f"""请判断以下文档块与查询的相关程度，用0到10之间的整数打分（10表示最相关）。
+只返回分数，不添加任何解释。
 
 查询: {query}
 
 文档块:
-{document_list}
+{chunk['content'][:200]}...
 
-排序后的索引（从最相关到最不相关）:"""
-        
-        return prompt
+相关度分数:"""
     
-    def _parse_rerank_response(self, response: str, max_index: int) -> List[int]:
+    def _parse_score(self, response: Optional[str]) -> float:
         """
-        解析LLM返回的重排序结果
+        解析LLM返回的相关度分数
         
         参数:
             response: LLM返回的字符串
-            max_index: 最大有效索引
             
         返回:
-            排序后的索引列表
+            0-10之间的分数，请求出错或无法解析时返回-1（排在所有已打分文档块之后）
         """
-        # 解析逗号分隔的索引
-        reranked_indices = []
-        for idx_str in response.split(','):
-            idx_str = idx_str.strip()
-            if idx_str.isdigit():
-                idx = int(idx_str)
-                if 0 <= idx < max_index:
-                    reranked_indices.append(idx)
-        
-        # 添加未被LLM排序的索引（保持原始顺序）
-        remaining_indices = [
-            i for i in range(max_index)
-            if i not in reranked_indices
-        ]
-        
-        return reranked_indices + remaining_indices
+        # LLM客户端出错时返回以"错误"开头的提示文本，其中的状态码等数字不是分数
+        if not response or response.startswith("错误"):
+            return -1.0
+        match = _SCORE_PATTERN.search(response)
+        if match is None:
+            return -1.0
+        return min(float(match.group()), 10.0)
@@ -2,12 +2,27 @@
 检索模块 - 使用bge-large-zh-v1.5进行语义检索
 提供详细的评分计算和解释
 """
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
+from pathlib import Path
+import functools
+import hashlib
+import json
+import os
+import threading
 import numpy as np
 from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 from tqdm import tqdm
 
+from cache_manager import EmbeddingCache
+
+try:
+    import faiss
+except ImportError:  # 未安装faiss时退回暴力余弦检索
+    faiss = None
+
+# bge模型推荐的查询指令前缀
+_QUERY_INSTRUCTION = "为这个句子生成表示以用于检索相关文章："
+
 
 class Retriever:
     """检索器 - 使用bge-large-zh-v1.5进行高质量中文语义检索"""
@@ -15,7 +30,20 @@ class Retriever:
     def __init__(
         self,
         embedding_model: SentenceTransformer,
-        document_chunks: List[Dict]
+        document_chunks: List[Dict],
+        batch_size: int = 64,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        index_type: str = "flat",
+        hnsw_m: int = 32,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        index_path: Optional[Path] = None,
+        quantization: str = "fp32",
+        rescore_factor: int = 4,
+        query_cache_size: int = 4096,
+        model_name: Optional[str] = None,
+        hnsw_min_chunks: int = 5000,
+        query_prompt: str = _QUERY_INSTRUCTION
     ):
         """
         初始化检索器
@@ -23,26 +51,520 @@ class Retriever:
         参数:
             embedding_model: bge-large-zh-v1.5嵌入模型
             document_chunks: 文档块列表
+            batch_size: 批量编码的批大小
+            embedding_cache: 嵌入缓存（可选），已编码过的文档块直接复用
+            index_type: 向量索引类型，"flat"为暴力检索，"hnsw"为FAISS HNSW近似检索，
+                "auto"在文档块数不少于hnsw_min_chunks且已安装faiss时使用HNSW，否则暴力检索
+            hnsw_m: HNSW每个节点的邻居数
+            ef_construction: HNSW构建时的搜索宽度
+            ef_search: HNSW查询时的搜索宽度
+            index_path: 持久化路径（可选），FAISS索引和嵌入矩阵保存在该路径旁，以内存映射方式加载
+            quantization: 索引中向量的量化方式，"fp32" | "sq8"（int8标量量化） | "binary"（二值化）；
+                暴力检索时非fp32则扫描量化向量后用FP32重新打分
+            rescore_factor: 量化索引的候选倍数，取 top_k × rescore_factor 个候选后用FP32向量重新打分
+            query_cache_size: 查询向量LRU缓存的最大条目数
+            model_name: 嵌入模型名称（可选），计入持久化文件的指纹，更换模型后不会误用旧嵌入
+            hnsw_min_chunks: index_type为"auto"时启用HNSW的最少文档块数
+            query_prompt: 查询指令前缀（bge模型推荐为查询添加检索指令）
         """
         self.embedding_model = embedding_model
-        self.document_chunks = document_chunks
+        self.document_chunks = list(document_chunks)
+        # 检索结果所需字段按列存储（结构数组），构建结果时按索引取值，不复制整个文档块字典
+        self._columns = self._build_columns(self.document_chunks)
+        self.batch_size = batch_size
+        self.embedding_cache = embedding_cache
+        # 文档块较少时暴力检索已足够快且结果精确，数量较大时HNSW检索为亚线性
+        if index_type == "auto":
+            use_hnsw = faiss is not None and len(self.document_chunks) >= hnsw_min_chunks
+            index_type = "hnsw" if use_hnsw else "flat"
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.index_path = Path(index_path) if index_path else None
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.model_name = model_name
+        self.index = None
+        self._buffers = threading.local()  # 暴力检索的相似度输出缓冲区（每个线程一份，复用）
+        
+        # 模型已注册相同的"query"提示词时通过prompt_name交给sentence-transformers添加，否则手动拼接
+        self.query_prompt = query_prompt
+        prompts = getattr(embedding_model, "prompts", None) or {}
+        self._query_prompt_name = "query" if prompts.get("query") == query_prompt else None
+        
+        # 查询向量LRU缓存（按实例创建，ndarray不可哈希，缓存其字节表示）
+        self._embed_query_bytes = functools.lru_cache(maxsize=query_cache_size)(self._encode_query)
+        
+        # 已删除文档块的索引（墓碑），检索时过滤，超过阈值时压缩
+        self.tombstones = set()
+        self.compact_ratio = 0.2
+        
+        # 增量更新可能在后台线程中进行，与检索互斥
+        self._lock = threading.RLock()
+        # 增量更新之间串行执行；写盘、计算指纹和重建索引时只持有该锁，不阻塞检索
+        self._write_lock = threading.Lock()
+        
+        self._digest = None  # 指纹的哈希状态，新增文档块时在此基础上继续计算，无需重新哈希全部内容
+        self._persisted_rows = None  # 嵌入矩阵文件中与当前矩阵一致的行数（可直接追加时有效）
+        
+        # 文档块未变化时以只读内存映射加载嵌入矩阵，多个工作进程共享同一份物理内存
+        fingerprint = self._fingerprint() if self.index_path else None
+        self.chunk_embeddings = self._load_embeddings(fingerprint)
+        if self.chunk_embeddings is None:
+            print("正在使用 bge-large-zh-v1.5 生成文档嵌入向量...")
+            self.chunk_embeddings = self._encode_chunks(self.document_chunks, show_progress_bar=True)
+            print(f"✓ 成功生成 {len(document_chunks)} 个文档块的嵌入向量")
+            mapped = self._write_embeddings(self.chunk_embeddings, fingerprint)
+            if mapped is not None:
+                self.chunk_embeddings = mapped
+        
+        # HNSW近似检索，或暴力检索时对量化向量做精确扫描（int8/二值编码，扫描的数据量为FP32的1/4或1/32）
+        if self.index_type == "hnsw" or self.quantization != "fp32":
+            if faiss is None:
+                print("✗ 未安装faiss，退回暴力余弦检索（pip install faiss-cpu）")
+            else:
+                self.index = self._load_or_build_index(fingerprint)
+    
+    @staticmethod
+    def _build_columns(chunks: List[Dict]) -> Tuple[List, ...]:
+        """按列提取文档块字段：(标题, 块ID, 内容, 块序号, 总块数)"""
+        return (
+            [chunk["title"] for chunk in chunks],
+            [chunk.get("chunk_id") for chunk in chunks],
+            [chunk["content"] for chunk in chunks],
+            [chunk.get("chunk_index", 0) for chunk in chunks],
+            [chunk.get("total_chunks", 1) for chunk in chunks],
+        )
+    
+    def _encode_chunks(self, chunks: List[Dict], show_progress_bar: bool = False) -> np.ndarray:
+        """
+        批量生成文档块的嵌入向量
+        
+        参数:
+            chunks: 文档块列表
+            show_progress_bar: 是否显示进度条
+            
+        返回:
+            嵌入向量矩阵 (块数, 维度)
+        """
+        chunk_contents = [chunk["content"] for chunk in chunks]
+        if self.embedding_cache is None:
+            return self._encode_texts(chunk_contents, show_progress_bar)
         
-        print("正在使用 bge-large-zh-v1.5 生成文档嵌入向量...")
-        chunk_contents = [chunk["content"] for chunk in document_chunks]
+        # 只为缓存中没有的文档块生成嵌入向量
+        hashes = [EmbeddingCache.content_hash(content) for content in chunk_contents]
+        cached = self.embedding_cache.lookup(hashes)
+        missing = [idx for idx, vector in enumerate(cached) if vector is None]
         
-        self.chunk_embeddings = embedding_model.encode(
-            chunk_contents,
+        if missing:
+            if len(missing) < len(chunk_contents):
+                print(f"复用嵌入缓存: {len(chunk_contents) - len(missing)} 个文档块，"
+                      f"新编码: {len(missing)} 个")
+            new_embeddings = self._encode_texts(
+                [chunk_contents[idx] for idx in missing], show_progress_bar
+            )
+            self.embedding_cache.update([hashes[idx] for idx in missing], new_embeddings)
+            for idx, vector in zip(missing, new_embeddings):
+                cached[idx] = vector
+        
+        if not cached:
+            return self._encode_texts([], show_progress_bar)
+        return np.stack(cached).astype(np.float32, copy=False)
+    
+    def _encode_texts(
+        self,
+        texts: List[str],
+        show_progress_bar: bool = False,
+        prompt_name: Optional[str] = None
+    ) -> np.ndarray:
+        """使用嵌入模型批量编码文本（统一为连续的float32矩阵），prompt_name为模型注册的提示词名称"""
+        # 按长度排序后编码，同一批次内长度相近，减少填充token的计算；编码后还原原顺序
+        order = np.argsort([len(text) for text in texts], kind='stable')
+        embeddings = self.embedding_model.encode(
+            [texts[idx] for idx in order],
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
             normalize_embeddings=True,  # 归一化嵌入向量，提升检索效果
-            show_progress_bar=True,  # 显示进度条
-            batch_size=32
+            show_progress_bar=show_progress_bar,
+            **({"prompt_name": prompt_name} if prompt_name else {})
         )
-        print(f"✓ 成功生成 {len(document_chunks)} 个文档块的嵌入向量")
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(order):
+            embeddings = embeddings[np.argsort(order)]
+        return np.ascontiguousarray(embeddings)
+    
+    def _encode_query(self, query: str) -> bytes:
+        """编码查询文本，返回float32向量的字节表示"""
+        # 为查询添加指令前缀，提升检索效果（bge模型推荐做法）
+        if self._query_prompt_name:
+            embedding = self.embedding_model.encode(
+                [query],
+                prompt_name=self._query_prompt_name,
+                normalize_embeddings=True
+            )
+        else:
+            embedding = self.embedding_model.encode(
+                [self.query_prompt + query],
+                normalize_embeddings=True
+            )
+        return np.asarray(embedding, dtype=np.float32).tobytes()
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        获取查询向量（相同查询复用LRU缓存中的结果）
+        
+        参数:
+            query: 用户查询
+            
+        返回:
+            查询向量 (1, 维度)
+        """
+        return np.frombuffer(self._embed_query_bytes(query), dtype=np.float32).reshape(1, -1)
+    
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        批量编码多个查询（一次前向计算，不经过LRU缓存）
+        
+        参数:
+            queries: 查询列表
+            
+        返回:
+            查询向量矩阵 (查询数, 维度)
+        """
+        if self._query_prompt_name:
+            return self._encode_texts(queries, prompt_name=self._query_prompt_name)
+        return self._encode_texts([self.query_prompt + query for query in queries])
+    
+    def clear_query_cache(self) -> None:
+        """清空查询向量缓存"""
+        self._embed_query_bytes.cache_clear()
+    
+    def _fingerprint(self, chunks: Optional[List[Dict]] = None) -> str:
+        """根据嵌入模型和文档块内容（默认为当前文档块）计算指纹，用于校验持久化的嵌入矩阵和索引"""
+        self._digest = hashlib.sha256()
+        if self.model_name:
+            self._digest.update(self.model_name.encode('utf-8'))
+            self._digest.update(b"\x00")
+        return self._extend_fingerprint(self.document_chunks if chunks is None else chunks)
+    
+    def _extend_fingerprint(self, chunks: List[Dict]) -> str:
+        """将追加的文档块计入指纹（与对全部文档块重新计算的结果相同）"""
+        for chunk in chunks:
+            self._digest.update(chunk["content"].encode('utf-8'))
+            self._digest.update(b"\x00")
+        return self._digest.copy().hexdigest()
+    
+    @staticmethod
+    def _replace_file(path: Path, write_fn) -> None:
+        """先写入临时文件再原子替换，避免其他进程映射中的旧文件被截断"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        write_fn(tmp_path)
+        os.replace(tmp_path, path)
+    
+    def _embeddings_paths(self) -> Tuple[Path, Path]:
+        """嵌入矩阵文件及其元数据文件路径"""
+        stem = self.index_path.stem + "_embeddings"
+        return self.index_path.with_name(stem + ".f32"), self.index_path.with_name(stem + ".json")
+    
+    def _load_embeddings(self, fingerprint: Optional[str]) -> Optional[np.ndarray]:
+        """
+        以只读内存映射加载持久化的嵌入矩阵
+        
+        参数:
+            fingerprint: 当前文档块指纹
+            
+        返回:
+            嵌入矩阵 (块数, 维度)，文件不存在或指纹不匹配时返回None
+        """
+        if not fingerprint:
+            return None
+        
+        data_path, meta_path = self._embeddings_paths()
+        if not (data_path.exists() and meta_path.exists()):
+            return None
+        
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            if meta.get("fingerprint") != fingerprint or meta.get("count") != len(self.document_chunks):
+                return None
+            embeddings = np.memmap(
+                data_path, dtype=np.float32, mode='r', shape=(meta["count"], meta["dim"])
+            )
+            self._persisted_rows = meta["count"]
+            print(f"✓ 映射嵌入矩阵: {meta['count']} 个文档块")
+            return embeddings
+        except Exception as e:
+            print(f"嵌入矩阵文件损坏，重新生成: {e}")
+            return None
+    
+    def _write_embeddings_meta(self, fingerprint: str, count: int, dim: int) -> None:
+        """写入嵌入矩阵的元数据（指纹、行数、维度）"""
+        _, meta_path = self._embeddings_paths()
+        self._replace_file(meta_path, lambda path: path.write_text(
+            json.dumps({"fingerprint": fingerprint, "count": count, "dim": dim}),
+            encoding='utf-8'
+        ))
+    
+    def _write_embeddings(self, embeddings: np.ndarray, fingerprint: Optional[str]) -> Optional[np.memmap]:
+        """
+        将嵌入矩阵完整保存为连续的float32文件
+        
+        参数:
+            embeddings: 嵌入矩阵
+            fingerprint: 对应文档块的指纹
+            
+        返回:
+            文件的只读内存映射，未保存时返回None
+        """
+        if not fingerprint or not len(embeddings):
+            return None
+        
+        data_path, _ = self._embeddings_paths()
+        count, dim = embeddings.shape
+        try:
+            self._replace_file(data_path, np.ascontiguousarray(embeddings, dtype=np.float32).tofile)
+            self._write_embeddings_meta(fingerprint, count, dim)
+            self._persisted_rows = count
+            return np.memmap(data_path, dtype=np.float32, mode='r', shape=(count, dim))
+        except Exception as e:
+            self._persisted_rows = None
+            print(f"保存嵌入矩阵失败: {e}")
+            return None
+    
+    def _append_embeddings(self, new_embeddings: np.ndarray) -> Optional[np.memmap]:
+        """
+        将新增的嵌入向量追加到矩阵文件末尾，只写入新行
+        已有的内存映射只覆盖文件前部，追加不影响其他进程正在读取的数据
+        
+        参数:
+            new_embeddings: 新增的嵌入向量
+            
+        返回:
+            覆盖全部行的只读内存映射；文件与当前矩阵不一致（无法追加）时返回None
+        """
+        data_path, _ = self._embeddings_paths()
+        count = len(self.chunk_embeddings)
+        dim = new_embeddings.shape[1]
+        try:
+            if (self._persisted_rows != count or not data_path.exists()
+                    or data_path.stat().st_size != count * dim * 4):
+                return None
+            with open(data_path, 'ab') as f:
+                f.write(np.ascontiguousarray(new_embeddings, dtype=np.float32).tobytes())
+            self._persisted_rows = count + len(new_embeddings)
+            return np.memmap(data_path, dtype=np.float32, mode='r', shape=(self._persisted_rows, dim))
+        except Exception as e:
+            self._persisted_rows = None
+            print(f"追加嵌入矩阵失败: {e}")
+            return None
+    
+    def _index_vectors(self, embeddings: np.ndarray) -> np.ndarray:
+        """将FP32嵌入转换为索引所需的格式（二值化时按符号位打包为uint8）"""
+        if self.quantization == "binary":
+            return np.packbits(embeddings > 0, axis=1)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+    
+    @property
+    def _index_label(self) -> str:
+        """索引类型的显示名称"""
+        return "HNSW" if self.index_type == "hnsw" else "Flat"
+    
+    def _build_index(self, embeddings: Optional[np.ndarray] = None):
+        """
+        使用FAISS构建向量索引（HNSW，或暴力检索时的量化Flat索引）
+        
+        fp32/sq8使用内积度量（向量已归一化，内积即余弦相似度），
+        binary使用汉明距离，检索后再用FP32向量重新打分
+        
+        参数:
+            embeddings: 建索引的嵌入矩阵，默认为当前的chunk_embeddings
+        """
+        if embeddings is None:
+            embeddings = self.chunk_embeddings
+        dim = embeddings.shape[1]
+        if self.index_type != "hnsw":
+            # 量化向量的精确扫描：FAISS以SIMD解码int8/计算汉明距离
+            if self.quantization == "binary":
+                index = faiss.IndexBinaryFlat(dim)
+            else:
+                index = faiss.IndexScalarQuantizer(
+                    dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+                )
+        elif self.quantization == "sq8":
+            index = faiss.IndexHNSWSQ(
+                dim, faiss.ScalarQuantizer.QT_8bit, self.hnsw_m, faiss.METRIC_INNER_PRODUCT
+            )
+        elif self.quantization == "binary":
+            index = faiss.IndexBinaryHNSW(dim, self.hnsw_m)
+        else:
+            index = faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        if self.index_type == "hnsw":
+            index.hnsw.efConstruction = self.ef_construction
+            index.hnsw.efSearch = self.ef_search
+        
+        if len(embeddings):
+            vectors = self._index_vectors(embeddings)
+            if not index.is_trained:
+                index.train(vectors)
+            index.add(vectors)
+        return index
+    
+    def _load_or_build_index(self, fingerprint: Optional[str]):
+        """加载持久化的向量索引（内存映射，只读），文档块或索引配置变化时重新构建"""
+        meta_path = self.index_path.with_suffix('.json') if self.index_path else None
+        
+        if fingerprint and self.index_path.exists() and meta_path.exists():
+            try:
+                meta = json.loads(meta_path.read_text(encoding='utf-8'))
+                if (meta.get("fingerprint") == fingerprint
+                        and meta.get("index_type", "hnsw") == self.index_type
+                        and meta.get("quantization", "fp32") == self.quantization):
+                    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                    if self.quantization == "binary":
+                        index = faiss.read_index_binary(str(self.index_path), flags)
+                    else:
+                        index = faiss.read_index(str(self.index_path), flags)
+                    if self.index_type == "hnsw":
+                        index.hnsw.efSearch = self.ef_search
+                    print(f"✓ 加载{self._index_label}索引: {index.ntotal} 个向量")
+                    return index
+            except Exception as e:
+                print(f"{self._index_label}索引损坏，重新构建: {e}")
+        
+        print(f"正在构建{self._index_label}索引...")
+        index = self._build_index()
+        
+        self._save_index(index, fingerprint)
+        return index
+    
+    def _save_index(self, index, fingerprint: Optional[str]) -> None:
+        """持久化向量索引及其元数据（含指纹），下次启动时直接映射"""
+        if not fingerprint:
+            return
+        
+        meta_path = self.index_path.with_suffix('.json')
+        try:
+            write_index = faiss.write_index_binary if self.quantization == "binary" else faiss.write_index
+            self._replace_file(self.index_path, lambda path: write_index(index, str(path)))
+            self._replace_file(meta_path, lambda path: path.write_text(
+                json.dumps({
+                    "fingerprint": fingerprint,
+                    "index_type": self.index_type,
+                    "quantization": self.quantization,
+                    "ntotal": index.ntotal
+                }),
+                encoding='utf-8'
+            ))
+        except Exception as e:
+            print(f"保存{self._index_label}索引失败: {e}")
+    
+    @property
+    def active_count(self) -> int:
+        """有效（未删除）的文档块数量"""
+        return len(self.document_chunks) - len(self.tombstones)
+    
+    def add_chunks(self, chunks: List[Dict]) -> None:
+        """
+        增量添加文档块，只为新块生成嵌入向量
+        
+        参数:
+            chunks: 新的文档块列表
+        """
+        if not chunks:
+            return
+        
+        new_embeddings = self._encode_chunks(chunks)
+        with self._write_lock:
+            # 新行直接追加到矩阵文件并重新映射，不在内存中复制整个矩阵，也不重写已有数据
+            mapped = self._append_embeddings(new_embeddings) if self.index_path else None
+            with self._lock:
+                if mapped is not None:
+                    self.chunk_embeddings = mapped
+                else:
+                    self.chunk_embeddings = np.vstack([self.chunk_embeddings, new_embeddings])
+                self.document_chunks.extend(chunks)
+                # 原地追加：检索中已取出的列引用对已有索引仍然有效
+                for column, values in zip(self._columns, self._build_columns(chunks)):
+                    column.extend(values)
+                if self.index is not None:
+                    self.index.add(self._index_vectors(new_embeddings))
+            
+            if not self.index_path:
+                return
+            
+            # 以下不持有检索锁：指纹只哈希新增的文档块
+            fingerprint = self._extend_fingerprint(chunks)
+            if mapped is not None:
+                self._write_embeddings_meta(fingerprint, *mapped.shape)
+            else:
+                # 文件不存在或与内存不一致（如初始为空、上次保存失败）时完整写入一次，之后即可追加
+                mapped = self._write_embeddings(self.chunk_embeddings, fingerprint)
+                if mapped is not None:
+                    with self._lock:
+                        self.chunk_embeddings = mapped
+            if self.index is not None:
+                self._save_index(self.index, fingerprint)
+    
+    def remove_chunks(self, title: str) -> int:
+        """
+        删除指定文档的所有文档块（标记墓碑，超过阈值时压缩）
+        
+        参数:
+            title: 文档标题
+            
+        返回:
+            删除的文档块数量
+        """
+        with self._write_lock:
+            with self._lock:
+                removed = [
+                    idx for idx, chunk in enumerate(self.document_chunks)
+                    if chunk["title"] == title and idx not in self.tombstones
+                ]
+                self.tombstones.update(removed)
+                need_compact = len(self.tombstones) > self.compact_ratio * len(self.document_chunks)
+            
+            if need_compact:
+                self._compact()
+        
+        return len(removed)
+    
+    def _compact(self) -> None:
+        """
+        压缩索引：丢弃墓碑对应的文档块和嵌入向量（无需重新编码）
+        调用方需持有_write_lock；重建索引和写盘期间检索继续使用旧数据（墓碑照常过滤），完成后一次性替换
+        """
+        with self._lock:
+            keep = [idx for idx in range(len(self.document_chunks)) if idx not in self.tombstones]
+            document_chunks = [self.document_chunks[idx] for idx in keep]
+            embeddings = np.ascontiguousarray(self.chunk_embeddings[keep])
+        
+        index = self._build_index(embeddings) if self.index is not None else None
+        fingerprint = None
+        if self.index_path:
+            fingerprint = self._fingerprint(document_chunks)
+            mapped = self._write_embeddings(embeddings, fingerprint)
+            if mapped is not None:
+                embeddings = mapped
+        
+        with self._lock:
+            self.document_chunks = document_chunks
+            self._columns = self._build_columns(document_chunks)
+            self.chunk_embeddings = embeddings
+            self.tombstones.clear()
+            self.index = index
+        
+        if index is not None:
+            self._save_index(index, fingerprint)
     
     def semantic_search(
         self, 
         query: str, 
         top_k: int = 5,
-        return_details: bool = False
+        return_details: bool = False,
+        query_embedding: Optional[np.ndarray] = None
     ) -> List[Tuple[int, float]] | List[Dict]:
         """
         使用bge-large-zh-v1.5进行语义检索
@@ -57,46 +579,206 @@ class Retriever:
             query: 用户查询
             top_k: 返回的结果数量
             return_details: 是否返回详细评分信息
+            query_embedding: 已编码的查询向量 (1, 维度)，为None时在此编码
             
         返回:
             元组列表 [(文档块索引, 相似度分数), ...] 或详细信息字典列表
         """
-        # 为查询添加指令前缀，提升检索效果（bge模型推荐做法）
-        query_with_instruction = f"为这个句子生成表示以用于检索相关文章：{query}"
-        
         # 生成查询向量
-        query_embedding = self.embedding_model.encode(
-            [query_with_instruction],
-            normalize_embeddings=True
-        )
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        
+        if self.index is not None:
+            top_results = self._index_search(query_embedding, top_k)
+        else:
+            top_results = self._flat_search(query_embedding, top_k)
+        
+        if return_details:
+            return [self._score_details(idx, score) for idx, score in top_results]
+        
+        return top_results
+    
+    def semantic_search_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        query_embeddings: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        批量语义检索：所有查询一次编码，再与文档块做一次矩阵乘法
+        
+        参数:
+            queries: 查询列表
+            top_k: 每个查询返回的结果数量
+            query_embeddings: 已编码的查询向量矩阵，为None时在此编码
+            
+        返回:
+            与queries顺序一致的 [(文档块索引, 相似度分数), ...] 列表
+        """
+        if query_embeddings is None:
+            query_embeddings = self.embed_queries(queries)
+        
+        if self.index is not None:
+            return self._index_search_batch(query_embeddings, top_k)
+        return self._flat_search_batch(query_embeddings, top_k)
+    
+    @staticmethod
+    def _score_details(idx: int, score: float) -> Dict:
+        """构建单个检索结果的详细评分信息"""
+        return {
+            'index': int(idx),
+            'score': score,
+            'score_type': 'bge_cosine_similarity',
+            'score_range': '[0, 1]',
+            'model': 'bge-large-zh-v1.5',
+            'explanation': (
+                f'BGE语义相似度: {score:.4f}\n'
+                f'使用bge-large-zh-v1.5模型计算查询与文档的语义相似程度\n'
+                f'分数越接近1表示语义越相关'
+            )
+        }
+    
+    def _flat_snapshot(self) -> Tuple[np.ndarray, List[int], Tuple[List, ...]]:
+        """
+        在锁内取出暴力检索所需数据的快照：嵌入矩阵、墓碑和文档块列
+        矩阵和列在更新时整体替换或只在末尾追加，墓碑原地修改，因此只拷贝墓碑
+        """
+        with self._lock:
+            return self.chunk_embeddings, list(self.tombstones), self._columns
+    
+    def _flat_search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int,
+        snapshot: Optional[Tuple[np.ndarray, List[int], Tuple[List, ...]]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        暴力检索：计算查询与所有文档块的余弦相似度
+        
+        参数:
+            query_embedding: 查询向量 (1, 维度)
+            top_k: 返回的结果数量
+            snapshot: _flat_snapshot()的结果，为None时在此获取
+            
+        返回:
+            [(文档块索引, 相似度分数), ...]，按分数降序
+        """
+        # 只在取快照时持有锁，相似度计算不阻塞其他检索（矩阵乘法期间numpy释放GIL）
+        embeddings, tombstones, _ = snapshot or self._flat_snapshot()
         
         # 计算余弦相似度
-        # 由于向量已归一化，余弦相似度 = 点积
+        # 由于向量已归一化，余弦相似度 = 点积，直接做一次矩阵-向量乘法
         # 相似度范围: [0, 1]，值越大表示语义越相似
-        similarities = cosine_similarity(query_embedding, self.chunk_embeddings)[0]
+        # 结果写入本线程复用的缓冲区，避免每次查询分配（并触发缺页）一个长度为文档块数的新数组
+        count = len(embeddings)
+        scores = getattr(self._buffers, 'scores', None)
+        if scores is None or len(scores) < count:
+            scores = self._buffers.scores = np.empty(count, dtype=np.float32)
+        similarities = np.matmul(embeddings, query_embedding[0], out=scores[:count])
+        
+        # 过滤已删除的文档块
+        if tombstones:
+            similarities[tombstones] = -np.inf
+            top_k = min(top_k, count - len(tombstones))
         
         # 获取最相关的文档块索引（降序排列）
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
+        # 先用argpartition线性选出top_k个候选，只对这k个排序
+        if top_k <= 0:
+            return []
+        if top_k < len(similarities):
+            candidates = np.argpartition(similarities, -top_k)[-top_k:]
+        else:
+            candidates = np.arange(len(similarities))
+        top_indices = candidates[np.argsort(-similarities[candidates], kind='stable')]
+        return [(int(idx), float(similarities[idx])) for idx in top_indices]
+    
+    def _flat_search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int,
+        snapshot: Optional[Tuple[np.ndarray, List[int], Tuple[List, ...]]] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        批量暴力检索：一次矩阵乘法计算所有查询与所有文档块的相似度
         
-        if return_details:
-            results = []
-            for idx in top_indices:
-                score = float(similarities[idx])
-                results.append({
-                    'index': int(idx),
-                    'score': score,
-                    'score_type': 'bge_cosine_similarity',
-                    'score_range': '[0, 1]',
-                    'model': 'bge-large-zh-v1.5',
-                    'explanation': (
-                        f'BGE语义相似度: {score:.4f}\n'
-                        f'使用bge-large-zh-v1.5模型计算查询与文档的语义相似程度\n'
-                        f'分数越接近1表示语义越相关'
-                    )
-                })
-            return results
+        参数:
+            query_embeddings: 查询向量矩阵 (查询数, 维度)
+            top_k: 每个查询返回的结果数量
+            snapshot: _flat_snapshot()的结果，为None时在此获取
+            
+        返回:
+            每个查询的 [(文档块索引, 相似度分数), ...]，按分数降序
+        """
+        embeddings, tombstones, _ = snapshot or self._flat_snapshot()
         
-        return [(int(idx), float(similarities[idx])) for idx in top_indices]
+        # (查询数, 文档块数) 相似度矩阵
+        similarities = query_embeddings @ embeddings.T
+        
+        if tombstones:
+            similarities[:, tombstones] = -np.inf
+            top_k = min(top_k, len(embeddings) - len(tombstones))
+        
+        if top_k <= 0:
+            return [[] for _ in range(len(query_embeddings))]
+        if top_k < similarities.shape[1]:
+            candidates = np.argpartition(similarities, -top_k, axis=1)[:, -top_k:]
+        else:
+            candidates = np.broadcast_to(np.arange(similarities.shape[1]), similarities.shape)
+        candidate_scores = np.take_along_axis(similarities, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind='stable')
+        top_indices = np.take_along_axis(candidates, order, axis=1)
+        top_scores = np.take_along_axis(candidate_scores, order, axis=1)
+        return [
+            [(int(idx), float(score)) for idx, score in zip(row_indices, row_scores)]
+            for row_indices, row_scores in zip(top_indices, top_scores)
+        ]
+    
+    def _index_search(self, query_embedding: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        """
+        FAISS检索：在HNSW或量化Flat索引中查找最相近的文档块
+        
+        参数:
+            query_embedding: 查询向量 (1, 维度)
+            top_k: 返回的结果数量
+            
+        返回:
+            [(文档块索引, 相似度分数), ...]，按分数降序
+        """
+        return self._index_search_batch(query_embedding, top_k)[0]
+    
+    def _index_search_batch(self, query_embeddings: np.ndarray, top_k: int) -> List[List[Tuple[int, float]]]:
+        """
+        批量FAISS检索（FAISS一次搜索多个查询向量）
+        
+        参数:
+            query_embeddings: 查询向量矩阵 (查询数, 维度)
+            top_k: 每个查询返回的结果数量
+            
+        返回:
+            每个查询的 [(文档块索引, 相似度分数), ...]，按分数降序
+        """
+        # 量化索引多取候选，用FP32向量重新打分以保证召回
+        # 再多取墓碑数量的结果，过滤已删除的文档块后仍能返回top_k个
+        candidates = top_k if self.quantization == "fp32" else top_k * self.rescore_factor
+        k = min(candidates + len(self.tombstones), self.index.ntotal)
+        scores, indices = self.index.search(self._index_vectors(query_embeddings), k)
+        
+        results = []
+        for query_embedding, row_scores, row_indices in zip(query_embeddings, scores, indices):
+            hits = [
+                (int(idx), float(score))
+                for idx, score in zip(row_indices, row_scores)
+                if idx >= 0 and idx not in self.tombstones
+            ]
+            
+            if self.quantization != "fp32" and hits:
+                candidate_ids = np.array([idx for idx, _ in hits])
+                exact_scores = self.chunk_embeddings[candidate_ids] @ query_embedding
+                order = np.argsort(exact_scores)[::-1]
+                hits = [(int(candidate_ids[i]), float(exact_scores[i])) for i in order]
+            
+            results.append(hits[:top_k])
+        return results
     
     def retrieve(
         self,
@@ -115,25 +797,107 @@ class Retriever:
         返回:
             相关文档块列表，每个块包含原始信息和相关度分数
         """
-        if not self.document_chunks:
+        if not self.active_count:
             return []
         
+        # 查询编码（LRU未命中时是模型前向计算）在锁外进行，并发请求不会在编码上排队
+        query_embedding = self.embed_query(query)
+        
         # 使用bge-large-zh-v1.5进行语义检索
-        search_results = self.semantic_search(
-            query, top_k, return_details=return_score_details
-        )
+        snapshot = None
+        with self._lock:
+            if not self.active_count:
+                return []
+            
+            if self.index is not None:
+                # FAISS索引在增量更新时原地添加，检索在锁内进行
+                search_results = self._index_search(query_embedding, top_k)
+                columns = self._columns
+            else:
+                # 暴力检索只在锁内取快照，相似度计算在锁外进行，并发检索互不阻塞
+                snapshot = self._flat_snapshot()
+        
+        if snapshot is not None:
+            search_results = self._flat_search(query_embedding, top_k, snapshot)
+            columns = snapshot[2]
         
+        if return_score_details:
+            search_results = [self._score_details(idx, score) for idx, score in search_results]
+        return self._to_chunks(search_results, columns, return_score_details)
+    
+    def retrieve_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        return_score_details: bool = False
+    ) -> List[List[Dict]]:
+        """
+        批量执行语义检索（查询一次编码、一次矩阵乘法）
+        
+        参数:
+            queries: 查询列表
+            top_k: 每个查询返回的结果数量
+            return_score_details: 是否返回详细评分信息
+            
+        返回:
+            与queries顺序一致的相关文档块列表
+        """
+        if not self.active_count or not queries:
+            return [[] for _ in queries]
+        
+        # 批量编码是整段模型前向计算，在锁外进行，锁内只做索引检索或取快照
+        query_embeddings = self.embed_queries(queries)
+        
+        snapshot = None
+        with self._lock:
+            if not self.active_count:
+                return [[] for _ in queries]
+            
+            if self.index is not None:
+                batch_results = self._index_search_batch(query_embeddings, top_k)
+                columns = self._columns
+            else:
+                snapshot = self._flat_snapshot()
+        
+        if snapshot is not None:
+            batch_results = self._flat_search_batch(query_embeddings, top_k, snapshot)
+            columns = snapshot[2]
+        
+        if return_score_details:
+            batch_results = [
+                [self._score_details(idx, score) for idx, score in results]
+                for results in batch_results
+            ]
+        return [
+            self._to_chunks(results, columns, return_score_details)
+            for results in batch_results
+        ]
+    
+    @staticmethod
+    def _to_chunks(search_results: List, columns: Tuple[List, ...], return_score_details: bool) -> List[Dict]:
+        """
+        将检索结果转换为带相关度分数的文档块
+        只包含标题、块ID、内容、位置和分数，不携带original_doc（缓存和接口响应中不再重复整篇文档）
+        """
+        titles, chunk_ids, contents, chunk_indexes, total_chunks = columns
         retrieved_chunks = []
         for result in search_results:
             if return_score_details and isinstance(result, dict):
-                chunk = self.document_chunks[result['index']].copy()
-                chunk["score"] = result['score']
-                chunk["score_details"] = result
+                idx = result['index']
+                score = result['score']
             else:
-                chunk_idx, relevance_score = result
-                chunk = self.document_chunks[chunk_idx].copy()
-                chunk["score"] = relevance_score
+                idx, score = result
             
+            chunk = {
+                "title": titles[idx],
+                "chunk_id": chunk_ids[idx],
+                "content": contents[idx],
+                "chunk_index": chunk_indexes[idx],
+                "total_chunks": total_chunks[idx],
+                "score": score
+            }
+            if return_score_details and isinstance(result, dict):
+                chunk["score_details"] = result
             retrieved_chunks.append(chunk)
         
         return retrieved_chunks
@@ -149,6 +913,9 @@ class Retriever:
             'model_name': 'bge-large-zh-v1.5',
             'model_type': 'Chinese Semantic Embedding',
             'embedding_dimension': self.chunk_embeddings.shape[1],
-            'total_documents': len(self.document_chunks),
-            'retrieval_method': 'Semantic Search (Cosine Similarity)'
+            'total_documents': self.active_count,
+            'retrieval_method': (
+                f'Semantic Search (FAISS {self._index_label}, {self.quantization})' if self.index is not None
+                else 'Semantic Search (Cosine Similarity)'
+            )
         }
@@ -2,12 +2,18 @@
 文本处理模块 - 负责文本分块和预处理
 使用jieba进行中文文本处理，支持自定义词典
 """
-from typing import List
+from typing import List, Iterator
 import re
 import jieba
 import jieba.posseg as pseg
 
 
+# 句子：中文句末标点（句号、问号、感叹号、分号）和换行之间的文本
+_SENTENCE_PATTERN = re.compile(r'[^。！？；\n]+')
+
+# 有效词须包含中文字符或字母数字
+_VALID_WORD_PATTERN = re.compile(r'[\u4e00-\u9fff]|[a-zA-Z0-9]')
+
 class TextProcessor:
     """文本处理器 - 处理中文文本分块和分词"""
     
@@ -49,21 +55,21 @@ class TextProcessor:
            # print(f"已加载 {len(custom_words)} 个自定义词汇: {', '.join(custom_words)}")
             print(f"已加载 {len(custom_words)} 个自定义词汇")
     
-    def _load_chinese_stopwords(self) -> set:
+    def _load_chinese_stopwords(self) -> frozenset:
         """
         加载中文停用词
         
         返回:
-            停用词集合
+            停用词集合（不可变）
         """
         # 常用中文停用词
-        stopwords = {
+        stopwords = frozenset({
             '的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一',
             '一个', '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有',
             '看', '好', '自己', '这', '那', '里', '为', '与', '而', '且', '或', '但',
             '因为', '所以', '如果', '虽然', '然而', '因此', '于是', '并且', '以及',
             '以', '及', '等', '等等', '之', '其', '中', '对', '从', '把', '被', '让'
-        }
+        })
         return stopwords
     
     def split_into_chunks(self, text: str) -> List[str]:
@@ -77,12 +83,12 @@ class TextProcessor:
         返回:
             分块后的文本列表
         """
-        # 按照中文标点符号（句号、问号、感叹号、省略号等）分句
-        sentence_delimiters = r'[。！？；\n]+'
-        sentences = [s.strip() for s in re.split(sentence_delimiters, text) if s.strip()]
+        # 按照中文标点符号（句号、问号、感叹号、分号）和换行分句
+        sentences = [s for s in (m.group().strip() for m in _SENTENCE_PATTERN.finditer(text)) if s]
         
         chunks = []
         current_chunk = []
+        lengths = []  # 与current_chunk一一对应的句子长度
         current_length = 0
         
         for sentence in sentences:
@@ -92,19 +98,21 @@ class TextProcessor:
             if current_length + sentence_length > self.chunk_size and current_chunk:
                 chunks.append("".join(current_chunk))
                 
-                # 重叠处理：从上一个块的末尾取部分内容
-                overlap_sentences = []
+                # 重叠处理：从上一个块末尾向前累计句子长度，至少保留一句，再一次性切片
+                k = 0
                 overlap_length = 0
-                for sent in reversed(current_chunk):
-                    overlap_sentences.insert(0, sent)
-                    overlap_length += len(sent)
+                while k < len(lengths):
+                    k += 1
+                    overlap_length += lengths[-k]
                     if overlap_length >= self.chunk_overlap:
                         break
                 
-                current_chunk = overlap_sentences
+                current_chunk = current_chunk[-k:]
+                lengths = lengths[-k:]
                 current_length = overlap_length
             
             current_chunk.append(sentence)
+            lengths.append(sentence_length)
             current_length += sentence_length
         
         # 添加最后一个块
@@ -113,7 +121,7 @@ class TextProcessor:
         
         return chunks
     
-    def tokenize_and_filter(self, text: str) -> List[str]:
+    def tokenize_and_filter(self, text: str) -> Iterator[str]:
         """
         使用jieba进行中文分词并过滤停用词
         
@@ -121,17 +129,16 @@ class TextProcessor:
             text: 要处理的文本
             
         返回:
-            过滤后的词列表
+            过滤后的词迭代器（逐个产出，不构建中间列表；需要列表时用list()包装）
         """
-        words = jieba.lcut(text)
+        stop_words = self.stop_words
+        is_valid_word = self._is_valid_word
         
         # 过滤停用词和无效词
-        filtered_words = [
-            word for word in words
-            if word not in self.stop_words and self._is_valid_word(word)
-        ]
-        
-        return filtered_words
+        return (
+            word for word in jieba.cut(text)
+            if word not in stop_words and is_valid_word(word)
+        )
     
     def tokenize_with_pos(self, text: str) -> List[tuple]:
         """
@@ -161,4 +168,4 @@ class TextProcessor:
             return False
         
         # 检查是否包含中文字符或字母数字
-        return bool(re.search(r'[\u4e00-\u9fff]|[a-zA-Z0-9]', word))
+        return _VALID_WORD_PATTERN.search(word) is not None